@@ -0,0 +1,108 @@
+from collections import namedtuple
+
+from scoring import score_record
+
+# Per-event-type aggregates kept as store counters and updated on every
+# save: the old record's contribution is subtracted and the new one added,
+# so the cost of a save doesn't depend on how many events exist. Scores are
+# also counted in a fixed histogram (HISTOGRAM_STEP points per bin), which
+# is the percentile sketch used for the median and percentile ranks.
+
+HISTOGRAM_STEP = 0.1
+HISTOGRAM_BINS = int(round(100 / HISTOGRAM_STEP)) + 1
+
+PREFIX = "agg|"
+BUILT = PREFIX + "built"
+
+TypeStats = namedtuple("TypeStats", "event_type events mean_score median_score implemented applicable histogram")
+
+
+def _name(event_type, field):
+    return f"{PREFIX}{event_type}|{field}"
+
+
+def score_bin(score):
+    return min(max(int(round(score / HISTOGRAM_STEP)), 0), HISTOGRAM_BINS - 1)
+
+
+def _contribution(event_id, record, sign):
+    event_type, score = score_record(event_id, record)
+    return {
+        _name(event_type, "events"): sign,
+        _name(event_type, "implemented"): sign * score.implemented,
+        _name(event_type, "applicable"): sign * score.applicable,
+        _name(event_type, "score_sum"): sign * score.score,
+        _name(event_type, f"hist|{score_bin(score.score)}"): sign,
+    }
+
+
+def on_put(store, event_id, old_record, new_record):
+    if old_record is not None:
+        for name, delta in _contribution(event_id, old_record, -1).items():
+            store.increment(name, delta)
+    for name, delta in _contribution(event_id, new_record, 1).items():
+        store.increment(name, delta)
+
+
+def rebuild(store):
+    # One full scan, for stores written before the index existed
+    deltas = {BUILT: 1}
+    for event_id, record, _ in store.iter_records():
+        for name, delta in _contribution(event_id, record, 1).items():
+            deltas[name] = deltas.get(name, 0) + delta
+    store.add_counters(deltas)
+
+
+def _backfill(store):
+    if not store.counters().get(BUILT):
+        rebuild(store)
+
+
+def attach(store):
+    # Keep the index up to date from now on, building it first if this
+    # store predates it
+    store.add_listener(on_put, backfill=_backfill)
+    return store
+
+
+def type_stats(store, event_type):
+    prefix = f"{PREFIX}{event_type}|"
+    fields = {}
+    histogram = [0] * HISTOGRAM_BINS
+    for name, value in store.counters().items():
+        if not name.startswith(prefix):
+            continue
+        field = name[len(prefix):]
+        if field.startswith("hist|"):
+            histogram[int(field[5:])] = int(round(value))
+        else:
+            fields[field] = value
+    events = int(round(fields.get("events", 0)))
+    if events <= 0:
+        return None
+    return TypeStats(
+        event_type,
+        events,
+        fields["score_sum"] / events,
+        quantile(histogram, events, 0.5),
+        int(round(fields["implemented"])),
+        int(round(fields["applicable"])),
+        histogram,
+    )
+
+
+def quantile(histogram, total, q):
+    target = q * total
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen >= target and count:
+            return index * HISTOGRAM_STEP
+    return 100.0
+
+
+def percentile_rank(stats, score):
+    # Share of events of this type scoring below `score`, counting ties as half
+    position = score_bin(score)
+    below = sum(stats.histogram[:position])
+    return (below + stats.histogram[position] / 2) * 100.0 / stats.events
@@ -0,0 +1,125 @@
+"""Measure the app's cold start and first render, and check them against a budget.
+
+    python bench/cold_start.py
+    python bench/cold_start.py --events 1000 --repeat 5 --import-budget-ms 800 --render-budget-ms 2500
+
+Every sample runs in a fresh Python process, as a worker restart would:
+
+    import          importing streamlit and the app's modules
+    first_render    the first AppTest run of checklist.py against a store of
+                    --events synthetic events (100 by default)
+    results_render  then switching to the Results page (skipped for an
+                    empty store, which has no event to show)
+
+Neither render may load numpy or pandas. Exits with status 1 when the
+median of any phase is over its budget (both renders share one), or when
+the heavy libraries were loaded, so it can guard against startup
+regressions.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be loaded until a page needs them
+HEAVY_MODULES = ("numpy", "pandas", "pyarrow")
+
+APP_MODULES = ("aggregates", "catalog", "history", "metrics", "persister", "registry", "scoring", "storage")
+
+
+def child():
+    # One cold start: timings in ms and the heavy modules that got loaded
+    start = time.perf_counter()
+    import streamlit  # noqa: F401
+    for name in APP_MODULES:
+        __import__(name)
+    import_ms = (time.perf_counter() - start) * 1000
+
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(ROOT, "checklist.py"), default_timeout=120)
+    start = time.perf_counter()
+    app.run()
+    render_ms = (time.perf_counter() - start) * 1000
+    if app.exception:
+        raise SystemExit(f"first render failed: {app.exception}")
+    result = {"import": import_ms, "first_render": render_ms}
+
+    if app.sidebar.radio:
+        start = time.perf_counter()
+        app.sidebar.radio[0].set_value("Results").run()
+        result["results_render"] = (time.perf_counter() - start) * 1000
+        if app.exception:
+            raise SystemExit(f"Results render failed: {app.exception}")
+    result["heavy_modules"] = [name for name in HEAVY_MODULES if name in sys.modules]
+    print(json.dumps(result))
+
+
+def cold_start(path):
+    env = dict(os.environ, ECO_PROGRESS_STORE=path, ECO_HISTORY_PATH=path + ".history.db", ECO_FLUSH_INTERVAL="0.05")
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child"],
+        env=env, check=True, capture_output=True, text=True, cwd=ROOT,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=100, help="synthetic events in the store")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--import-budget-ms", type=float, default=1000)
+    parser.add_argument("--render-budget-ms", type=float, default=3000)
+    parser.add_argument("--output", help="also write the samples here as JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    workdir = tempfile.mkdtemp(prefix="eco-cold-start-")
+    path = os.path.join(workdir, "progress.db")
+    if args.events:
+        from synth import build_store
+
+        build_store(path, args.events, 0)
+
+    samples = {"import": [], "first_render": [], "results_render": []}
+    heavy = set()
+    for _ in range(args.repeat):
+        result = cold_start(path)
+        for phase, values in samples.items():
+            if phase in result:
+                values.append(result[phase])
+        heavy.update(result["heavy_modules"])
+    samples = {phase: values for phase, values in samples.items() if values}
+
+    budgets = {"import": args.import_budget_ms, "first_render": args.render_budget_ms, "results_render": args.render_budget_ms}
+    failures = []
+    for phase, values in samples.items():
+        median = statistics.median(values)
+        print(f"{phase:14} median {median:8.1f} ms   max {max(values):8.1f} ms   budget {budgets[phase]:8.1f} ms")
+        if median > budgets[phase]:
+            failures.append(f"{phase} took {median:.1f} ms, over its {budgets[phase]:.0f} ms budget")
+    if heavy:
+        failures.append(f"loaded while rendering: {', '.join(sorted(heavy))}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"events": args.events, "samples_ms": samples, "budgets_ms": budgets, "heavy_modules": sorted(heavy)}, f, indent=2)
+
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
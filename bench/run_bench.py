@@ -0,0 +1,245 @@
+"""Time the app's hot paths against synthetic stores of several sizes.
+
+    python bench/run_bench.py --sizes 1000 10000 100000 --output bench_results.json
+    python bench/run_bench.py --sizes 1000 --backends db --no-apptest
+
+For every size and backend a synthetic store is generated (bench/synth.py)
+and these phases are timed:
+
+    open_store            first read after opening: loads the event index
+    load_progress         ProgressSession.open() of a random event
+    save_progress         synchronous save of a one-item change
+    save_progress_queued  the same save handed to the write-behind persister
+    load_checklist_merge  get_checklist() + record_state() for a stored event
+    score_event           the Results page score for one event
+    score_store           batch scores for every stored event
+    weighted_score        the Results page impact-weighted score
+    top_suggestions       the Results page's highest-impact missing items
+    reweight_store        impact-weighted scores for every stored event
+    registry_build        building the event registry's indexes
+    registry_<query>      event picker searches: newest, name prefix,
+                          type, date range, score band and all combined
+    measures_build        building the custom-measure index
+    measures_<query>      custom-measure suggestions: none typed, a
+                          prefix, whole words and a misspelling
+    rerun:<page>          end-to-end AppTest rerun of each sidebar page
+
+Results are written as JSON (one entry per size/backend/phase with
+min/median/p95 milliseconds) so runs can be diffed or charted.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from catalog import get_checklist, record_identity, record_state, set_bit, updated_record
+from persister import WriteBehind
+from measures import MeasureIndex
+from registry import EventRegistry
+from scoring import ImpactWeights, collect, score_event, score_store, top_suggestions, weighted_score, weighted_scores
+from storage import ProgressSession, open_store
+from synth import build_store
+
+BACKEND_SUFFIXES = {"json": ".json", "db": ".db"}
+
+
+def timings(fn, repeat, setup=None):
+    # setup() runs untimed before each call and its result is passed to fn
+    samples = []
+    for _ in range(repeat):
+        arguments = (setup(),) if setup is not None else ()
+        start = time.perf_counter()
+        fn(*arguments)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def summary(samples):
+    ordered = sorted(samples)
+    return {
+        "runs": len(ordered),
+        "min_ms": round(ordered[0], 4),
+        "median_ms": round(statistics.median(ordered), 4),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+    }
+
+
+def bench_store(path, repeat, rng):
+    results = {}
+
+    def cold_open():
+        store = open_store(path)
+        store.version("")
+        store.close()
+
+    results["open_store"] = timings(cold_open, max(3, repeat // 10))
+
+    store = open_store(path)
+    event_ids = store.event_ids()
+
+    def pick():
+        return rng.choice(event_ids)
+
+    results["load_progress"] = timings(lambda event_id: ProgressSession(store).open(event_id), repeat, pick)
+
+    def load_and_merge(event_id):
+        record, _ = store.get(event_id)
+        event_type, _ = record_identity(event_id, record)
+        record_state(record, get_checklist(event_type))
+
+    results["load_checklist_merge"] = timings(load_and_merge, repeat, pick)
+
+    def edited_session(persister=None):
+        session = ProgressSession(store, persister)
+        record = session.open(pick())
+        event_type, event_date = record_identity(session.event_id, record)
+        checklist = get_checklist(event_type)
+        implemented, na = record_state(record, checklist)
+        item = rng.choice(checklist.items)
+        implemented = set_bit(implemented, item.id, not implemented >> item.id & 1)
+        session.update(updated_record(record, event_type, event_date, implemented, na, record["custom_measures"], str(datetime.now())))
+        return session
+
+    # Whole-file rewrites make JSON saves slow on big stores; fewer runs
+    save_repeat = max(3, repeat // 4)
+    results["save_progress"] = timings(lambda session: session.save(), save_repeat, edited_session)
+    persister = WriteBehind(store, interval=0.05)
+    results["save_progress_queued"] = timings(lambda session: session.save(), repeat, lambda: edited_session(persister))
+    persister.flush()
+    persister.close()
+
+    def score_one(event_id):
+        record, _ = store.get(event_id)
+        event_type, _ = record_identity(event_id, record)
+        implemented, na = record_state(record, get_checklist(event_type))
+        score_event(event_type, implemented, na, record["custom_measures"])
+
+    results["score_event"] = timings(score_one, repeat, pick)
+    results["score_store"] = timings(lambda: score_store(store), max(3, repeat // 10))
+
+    weights = ImpactWeights()
+
+    def weighted_one(event_id):
+        record, _ = store.get(event_id)
+        event_type, _ = record_identity(event_id, record)
+        implemented, na = record_state(record, get_checklist(event_type))
+        weighted_score(event_type, implemented, na, record["custom_measures"], weights)
+
+    results["weighted_score"] = timings(weighted_one, repeat, pick)
+
+    def suggest_one(event_id):
+        record, _ = store.get(event_id)
+        event_type, _ = record_identity(event_id, record)
+        implemented, na = record_state(record, get_checklist(event_type))
+        top_suggestions(event_type, implemented, na, weights)
+
+    results["top_suggestions"] = timings(suggest_one, repeat, pick)
+    # Events already unpacked: the recompute a weight change needs
+    states = collect(store.iter_records())
+    results["reweight_store"] = timings(lambda: weighted_scores(states, ImpactWeights()), max(3, repeat // 10))
+
+    results["registry_build"] = timings(lambda: EventRegistry(open_store(path, cache_size=0)), max(3, repeat // 10))
+    registry = EventRegistry(store)
+    queries = {
+        "newest": {},
+        "name": {"text": "berl"},
+        "type": {"event_types": ["Board Meeting"]},
+        "date_range": {"start_date": "2024-03-01", "end_date": "2024-03-31"},
+        "score_band": {"min_score": 90, "max_score": 100},
+        "combined": {"text": "lis", "event_types": ["Product Launch"], "start_date": "2024-06-01", "end_date": "2025-06-01", "min_score": 40, "max_score": 60},
+    }
+    for name, query in queries.items():
+        results[f"registry_{name}"] = timings(lambda: registry.search(limit=200, **query), repeat)
+
+    results["measures_build"] = timings(lambda: MeasureIndex(open_store(path, cache_size=0)), max(3, repeat // 10))
+    measures = MeasureIndex(store)
+    for name, text in {"popular": "", "prefix": "re", "words": "bike racks ber", "typo": "reusble lanyrds"}.items():
+        results[f"measures_{name}"] = timings(lambda: measures.suggest(text, 5), repeat)
+    store.close()
+    return results
+
+
+def bench_apptest(path, repeat):
+    # Runs in a child process: the app reads ECO_PROGRESS_STORE on import
+    env = dict(os.environ, ECO_PROGRESS_STORE=path, ECO_FLUSH_INTERVAL="0.05")
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--apptest-child", "--repeat", str(repeat)],
+        env=env, check=True, capture_output=True, text=True, cwd=ROOT,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def apptest_child(repeat):
+    from streamlit.testing.v1 import AppTest
+
+    results = {}
+    app = AppTest.from_file(os.path.join(ROOT, "checklist.py"), default_timeout=120)
+    start = time.perf_counter()
+    app.run()
+    results["rerun:first_load"] = [(time.perf_counter() - start) * 1000]
+    for page in app.sidebar.radio[0].options:
+        app.sidebar.radio[0].set_value(page).run()
+        if app.exception:
+            raise SystemExit(f"{page}: {app.exception}")
+        results[f"rerun:{page}"] = timings(app.run, repeat)
+    print(json.dumps(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--backends", nargs="+", choices=sorted(BACKEND_SUFFIXES), default=["json", "db"])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--no-apptest", action="store_true", help="skip end-to-end page reruns")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--workdir", help="where synthetic stores are written (default: a temp dir)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--apptest-child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.apptest_child:
+        apptest_child(args.repeat)
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="eco-bench-")
+    rng = random.Random(args.seed)
+    entries = []
+    for size in args.sizes:
+        for backend in args.backends:
+            path = os.path.join(workdir, f"progress-{size}{BACKEND_SUFFIXES[backend]}")
+            start = time.perf_counter()
+            build_store(path, size, args.seed)
+            print(f"{backend} {size}: store built in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+            phases = bench_store(path, args.repeat, rng)
+            if not args.no_apptest:
+                phases.update(bench_apptest(path, args.repeat))
+            for phase, samples in phases.items():
+                entry = dict(size=size, backend=backend, phase=phase, **summary(samples))
+                entries.append(entry)
+                print(f"  {phase:24} median {entry['median_ms']:10.3f} ms   p95 {entry['p95_ms']:10.3f} ms", file=sys.stderr)
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": entries,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(entries)} results to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
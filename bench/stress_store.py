@@ -0,0 +1,75 @@
+"""Hammer a progress store from many threads and check no update is lost.
+
+    python bench/stress_store.py --threads 50 --ops 200 --events 20 --store /tmp/stress.db
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import ConflictError, open_store
+
+
+def worker(store, event_ids, ops, seed, stats):
+    rng = random.Random(seed)
+    conflicts = 0
+    for _ in range(ops):
+        event_id = rng.choice(event_ids)
+        # Read-modify-write with retry, exactly what a session does on conflict
+        while True:
+            record, version = store.get(event_id)
+            updated = dict(record or {"checklist": {}, "custom_measures": [], "clicks": 0})
+            updated["clicks"] = updated.get("clicks", 0) + 1
+            try:
+                store.put(event_id, updated, version)
+                break
+            except ConflictError:
+                conflicts += 1
+    with stats["lock"]:
+        stats["conflicts"] += conflicts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=50)
+    parser.add_argument("--ops", type=int, default=200, help="updates per thread")
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--store", help="store path (.json or .db); defaults to a temp file")
+    args = parser.parse_args()
+
+    path = args.store or os.path.join(tempfile.mkdtemp(), "stress.db")
+    store = open_store(path)
+    event_ids = [f"Stress Event_{i}" for i in range(args.events)]
+    before = sum((store.get(event_id)[0] or {}).get("clicks", 0) for event_id in event_ids)
+
+    stats = {"lock": threading.Lock(), "conflicts": 0}
+    threads = [
+        threading.Thread(target=worker, args=(store, event_ids, args.ops, seed, stats))
+        for seed in range(args.threads)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    store.close()
+
+    # Re-open from disk so we check what was actually committed
+    reopened = open_store(path)
+    after = sum(reopened.get(event_id)[0]["clicks"] for event_id in event_ids)
+    expected = args.threads * args.ops
+    committed = after - before
+    print(f"store: {path}")
+    print(f"{expected} updates in {elapsed:.2f}s ({expected / elapsed:.0f}/s), {stats['conflicts']} retried conflicts")
+    print(f"committed: {committed}, lost: {expected - committed}")
+    return 0 if committed == expected else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""Generate synthetic progress stores for benchmarking.
+
+    python bench/synth.py 10000 /tmp/bench-10k.json
+    python bench/synth.py 100000 /tmp/bench-100k.db --seed 7
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aggregates
+from catalog import CHECKLISTS, EVENT_TYPES, make_record
+from storage import open_store
+
+CUSTOM_MEASURES = [
+    "Bike racks at the venue",
+    "Reusable lanyards",
+    "Carbon offset for flights",
+    "No single-use plastic bottles",
+    "Solar-powered charging stations",
+    "Local flower arrangements",
+    "Paperless check-in",
+    "Leftover food donated",
+]
+
+OWNERS = ["Alex Morgan", "Sam Patel", "Jordan Lee", "Chris Novak", "Taylor Brooks", "Robin Okafor"]
+
+PLACES = ["London", "Berlin", "Dublin", "Leeds", "Glasgow", "Madrid", "Oslo", "Lisbon"]
+
+
+def variant(measure, rng):
+    # The same measure as different people write it down
+    if rng.random() < 0.3:
+        measure = f"{measure} in {rng.choice(PLACES)}"
+    if rng.random() < 0.2:
+        measure = measure.lower()
+    return measure
+
+
+def synthetic_records(count, seed=0, start=date(2024, 1, 1), days=730):
+    # Roughly half the items implemented, a few N/A, up to three custom measures
+    rng = random.Random(seed)
+    for index in range(count):
+        event_type = EVENT_TYPES[index % len(EVENT_TYPES)]
+        mask = CHECKLISTS[event_type].mask
+        bits = mask.bit_length()
+        implemented = rng.getrandbits(bits) & mask
+        na = rng.getrandbits(bits) & rng.getrandbits(bits) & mask & ~implemented
+        custom_measures = [
+            [variant(measure, rng), rng.random() < 0.5, rng.random() < 0.1]
+            for measure in rng.sample(CUSTOM_MEASURES, rng.randint(0, 3))
+        ]
+        event_date = str(start + timedelta(days=rng.randrange(days)))
+        event_id = f"{index:012x}"
+        name = f"{rng.choice(PLACES)} {event_type} {index}"
+        yield event_id, make_record(event_type, event_date, implemented, na, custom_measures, f"{event_date} 12:00:00", name, rng.choice(OWNERS))
+
+
+def build_store(path, count, seed=0):
+    # One put_many, i.e. one commit, for the whole store; aggregates are
+    # attached first so the store looks like one the app has been writing
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.unlink(path + suffix)
+    store = aggregates.attach(open_store(path, cache_size=0))
+    try:
+        store.put_many(dict(synthetic_records(count, seed)))
+    finally:
+        store.close()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("count", type=int)
+    parser.add_argument("path", help=".json or .db")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    build_store(args.path, args.count, args.seed)
+    print(f"Wrote {args.count} events to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
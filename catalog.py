@@ -0,0 +1,435 @@
+import json
+import os
+from collections import namedtuple
+
+from measures import normalize
+
+# Bump whenever items are added or retired. Stored events record the
+# version their bitmasks were written against.
+CATALOG_VERSION = 1
+
+EVENT_TYPES = (
+    "Conference or Seminar",
+    "Board Meeting",
+    "Team Building Event",
+    "Product Launch",
+    "Annual General Meeting",
+    "Trade Show or Exhibition",
+    "Corporate Party or Celebration",
+    "Other Corporate Event",
+)
+
+# Checklist items as (id, text, tip). The id is the item's bit in the
+# stored implemented/N-A masks, so it is permanent: never renumber or reuse
+# an id. To drop an item, delete it here and add its id to RETIRED_IDS.
+COMMON_ITEMS = {
+    "Venue Selection": [
+        (0, "Choose a venue with green certifications", "Look for LEED, BREEAM, or other sustainability certifications."),
+        (1, "Select a location accessible by public transport", "This reduces the carbon footprint of attendee travel."),
+        (2, "Opt for venues with natural lighting", "This can significantly reduce energy consumption."),
+        (3, "Choose a venue with efficient HVAC systems", "This can significantly reduce energy consumption for heating and cooling."),
+    ],
+    "Energy and Water": [
+        (4, "Use energy-efficient lighting and equipment", "LED lights and Energy Star certified equipment can greatly reduce energy use."),
+        (5, "Implement water-saving measures", "Use low-flow faucets and toilets, and avoid bottled water."),
+        (6, "Offset energy use with renewable energy credits", "This can help neutralize your event's carbon footprint."),
+        (7, "Use smart power strips and timers", "This can help reduce standby power consumption."),
+    ],
+    "Waste Management": [
+        (8, "Provide clearly labeled recycling and composting bins", "Make it easy for attendees to dispose of waste properly."),
+        (9, "Use digital materials instead of printed handouts", "This significantly reduces paper waste."),
+        (10, "Choose reusable or compostable serving ware", "Avoid single-use plastics and opt for sustainable alternatives."),
+        (11, "Partner with local recycling and composting facilities", "Ensure proper disposal of waste after the event."),
+    ],
+    "Food and Beverage": [
+        (12, "Offer plant-based and locally sourced food options", "This reduces the carbon footprint of your catering."),
+        (13, "Use bulk dispensers for beverages", "This eliminates the need for individual bottles or cans."),
+        (14, "Donate excess food to local charities", "This reduces food waste and supports the local community."),
+        (15, "Choose organic and fair trade options when possible", "This supports sustainable agriculture and fair labor practices."),
+    ],
+    "Transportation": [
+        (16, "Provide information on public transport options", "Encourage attendees to use eco-friendly transportation."),
+        (17, "Offer virtual attendance options", "This can significantly reduce travel-related emissions."),
+        (18, "Arrange shared transportation for off-site activities", "This is more efficient than individual transportation."),
+        (19, "Encourage carpooling among attendees", "Set up a carpooling system to reduce individual car use."),
+    ],
+}
+
+EVENT_SPECIFIC_ITEMS = {
+    "Conference or Seminar": {
+        "Technology": [
+            (20, "Use energy-efficient audiovisual equipment", "Choose equipment with power-saving modes."),
+            (21, "Offer virtual attendance options", "This can significantly reduce travel-related emissions."),
+            (22, "Provide digital conference materials", "Use apps or websites instead of printed programs."),
+            (23, "Implement a conference app for networking", "This can reduce the need for printed business cards and schedules."),
+        ],
+        "Session Planning": [
+            (24, "Include sustainability-focused sessions", "Educate attendees about sustainability in your industry."),
+            (25, "Use interactive polling to reduce paper use", "Digital polling can engage attendees without wasting paper."),
+            (26, "Offer workshops on sustainable practices", "Provide practical sustainability skills to attendees."),
+        ],
+    },
+    "Board Meeting": {
+        "Paper Reduction": [
+            (27, "Use digital voting systems", "Eliminate paper ballots for board decisions."),
+            (28, "Implement paperless document sharing", "Use secure digital platforms for sharing confidential documents."),
+            (29, "Provide tablets or laptops for document viewing", "This eliminates the need for printed documents during the meeting."),
+        ],
+        "Meeting Efficiency": [
+            (30, "Use video conferencing for remote participants", "This reduces travel-related emissions."),
+            (31, "Implement a strict agenda to reduce meeting time", "Shorter meetings consume less energy."),
+            (32, "Choose energy-efficient meeting room equipment", "Use low-power projectors and screens."),
+        ],
+    },
+    "Team Building Event": {
+        "Sustainable Activities": [
+            (33, "Choose eco-friendly team building activities", "Consider activities like park clean-ups or sustainable craft workshops."),
+            (34, "Use reusable name tags and team identifiers", "Avoid disposable items for team identification."),
+            (35, "Opt for outdoor activities when possible", "This can reduce energy consumption for indoor spaces."),
+            (36, "Incorporate sustainability education into activities", "Use the event as an opportunity to teach about environmental issues."),
+        ],
+        "Eco-friendly Rewards": [
+            (37, "Offer sustainable prizes or rewards", "Choose eco-friendly or locally made items as prizes."),
+            (38, "Provide digital certificates of participation", "Avoid printing paper certificates."),
+            (39, "Plant trees or donate to environmental causes in participants' names", "This creates a lasting positive impact."),
+        ],
+    },
+    "Product Launch": {
+        "Sustainable Promotion": [
+            (40, "Use eco-friendly promotional materials", "Choose recyclable or plantable promotional items."),
+            (41, "Highlight the product's sustainability features", "Educate attendees about the product's environmental impact."),
+            (42, "Implement digital product demonstrations", "Use screens or AR/VR to showcase products instead of physical samples."),
+            (43, "Offer sustainable packaging options", "If products are distributed, use minimal, recyclable packaging."),
+        ],
+        "Venue Setup": [
+            (44, "Use modular, reusable booth designs", "This reduces waste from single-use displays."),
+            (45, "Implement energy-efficient lighting for product displays", "Use LED lights to highlight products."),
+            (46, "Create a recycling plan for promotional materials", "Ensure that any distributed materials can be easily recycled."),
+        ],
+    },
+    "Annual General Meeting": {
+        "Shareholder Engagement": [
+            (47, "Offer online participation options", "Reduce travel emissions by allowing remote attendance and voting."),
+            (48, "Provide sustainability reports digitally", "Avoid printing large reports by offering digital versions."),
+            (49, "Use an event app for agenda and voting", "This can replace printed materials and paper ballots."),
+            (50, "Stream the meeting live for remote shareholders", "This allows participation without travel."),
+        ],
+        "Sustainable Presentations": [
+            (51, "Use energy-efficient presentation equipment", "Choose projectors and screens with low power consumption."),
+            (52, "Provide digital access to all meeting documents", "Allow shareholders to view documents on their own devices."),
+            (53, "Include a sustainability progress report in the agenda", "Highlight the company's environmental initiatives."),
+        ],
+    },
+    "Trade Show or Exhibition": {
+        "Booth Design": [
+            (54, "Use sustainable materials for booth construction", "Choose recyclable or reusable booth materials."),
+            (55, "Implement energy-efficient lighting in booths", "Use LED lights and minimize unnecessary lighting."),
+            (56, "Design modular booth elements for reuse", "Create booth components that can be reconfigured for future events."),
+            (57, "Use digital displays instead of printed banners", "This allows for easy updates and reduces waste."),
+        ],
+        "Exhibitor Guidelines": [
+            (58, "Provide exhibitors with sustainability guidelines", "Encourage all exhibitors to follow eco-friendly practices."),
+            (59, "Offer incentives for sustainable booth designs", "Recognize and reward exhibitors who prioritize sustainability."),
+            (60, "Implement a waste reduction competition among exhibitors", "Encourage innovative ways to minimize waste."),
+            (61, "Facilitate booth material recycling post-event", "Provide clear guidelines and services for material disposal."),
+        ],
+    },
+    "Corporate Party or Celebration": {
+        "Sustainable Decorations": [
+            (62, "Use reusable or biodegradable decorations", "Avoid single-use plastic decorations."),
+            (63, "Choose local and seasonal flowers or plants", "Reduce transportation emissions and support local businesses."),
+            (64, "Implement energy-efficient mood lighting", "Use LED string lights or solar-powered options."),
+            (65, "Create decorations from recycled materials", "Engage employees in creating unique, sustainable decor."),
+        ],
+        "Entertainment": [
+            (66, "Choose local entertainers to reduce travel", "This supports the local community and reduces transportation emissions."),
+            (67, "Opt for acoustic performances when possible", "This can reduce energy use for sound systems."),
+            (68, "Implement a sustainability theme in activities", "Incorporate eco-friendly messages into party games or performances."),
+            (69, "Use digital photo booths instead of printed photos", "Allow guests to receive photos electronically."),
+        ],
+    },
+}
+
+RETIRED_IDS = frozenset()
+
+Item = namedtuple("Item", "id category text tip")
+
+# categories is a tuple of (category, items) pairs in display order; mask
+# has a bit set for every item that belongs to this event type
+Checklist = namedtuple("Checklist", "event_type version categories items mask")
+
+
+def _compile(event_type):
+    categories = dict(COMMON_ITEMS)
+    categories.update(EVENT_SPECIFIC_ITEMS.get(event_type, {}))
+    compiled = tuple(
+        (category, tuple(Item(item_id, category, text, tip) for item_id, text, tip in items))
+        for category, items in categories.items()
+    )
+    items = tuple(item for _, category_items in compiled for item in category_items)
+    mask = 0
+    for item in items:
+        mask |= 1 << item.id
+    return Checklist(event_type, CATALOG_VERSION, compiled, items, mask)
+
+
+def _check_ids():
+    seen = set()
+    for categories in [COMMON_ITEMS] + list(EVENT_SPECIFIC_ITEMS.values()):
+        for items in categories.values():
+            for item_id, text, _ in items:
+                if item_id in seen or item_id in RETIRED_IDS:
+                    raise ValueError(f"Checklist item id {item_id} ({text!r}) is already in use")
+                seen.add(item_id)
+
+
+_check_ids()
+
+# Built once at import; every rerun shares these immutable objects
+CHECKLISTS = {event_type: _compile(event_type) for event_type in EVENT_TYPES}
+
+ITEMS_BY_ID = {item.id: item for checklist in CHECKLISTS.values() for item in checklist.items}
+
+# Width of the masks, for code that unpacks them into bit arrays
+MAX_ITEM_ID = max(list(ITEMS_BY_ID) + list(RETIRED_IDS))
+
+# Relative carbon/environmental impact of each item for impact-weighted
+# scores: 1 is a typical measure, travel and energy count most, awareness
+# and small paper savings least. Items missing here and custom measures
+# weigh DEFAULT_IMPACT_WEIGHT.
+DEFAULT_IMPACT_WEIGHT = 1.0
+
+IMPACT_WEIGHTS = {
+    # Venue Selection, Energy and Water
+    0: 3.0, 1: 4.0, 2: 1.5, 3: 3.0, 4: 2.0, 5: 1.5, 6: 3.0, 7: 0.5,
+    # Waste Management, Food and Beverage
+    8: 1.5, 9: 1.0, 10: 1.5, 11: 1.0, 12: 4.0, 13: 1.0, 14: 1.5, 15: 1.0,
+    # Transportation
+    16: 2.0, 17: 5.0, 18: 2.5, 19: 2.0,
+    # Conference or Seminar
+    20: 1.0, 21: 5.0, 22: 1.0, 23: 0.5, 24: 0.5, 25: 0.5, 26: 0.5,
+    # Board Meeting
+    27: 0.5, 28: 1.0, 29: 0.5, 30: 5.0, 31: 0.5, 32: 1.0,
+    # Team Building Event
+    33: 1.0, 34: 0.5, 35: 1.0, 36: 0.5, 37: 0.5, 38: 0.5, 39: 2.0,
+    # Product Launch
+    40: 1.0, 41: 0.5, 42: 1.5, 43: 2.0, 44: 2.0, 45: 1.0, 46: 1.0,
+    # Annual General Meeting
+    47: 5.0, 48: 1.0, 49: 0.5, 50: 3.0, 51: 1.0, 52: 1.0, 53: 0.5,
+    # Trade Show or Exhibition
+    54: 2.0, 55: 1.0, 56: 2.0, 57: 1.0, 58: 1.5, 59: 1.0, 60: 1.0, 61: 1.5,
+    # Corporate Party or Celebration
+    62: 1.0, 63: 1.0, 64: 1.0, 65: 0.5, 66: 2.0, 67: 0.5, 68: 0.5, 69: 0.5,
+}
+
+# A JSON file of {"<item id>": weight} overriding some or all of the above
+IMPACT_WEIGHTS_PATH = os.environ.get("ECO_IMPACT_WEIGHTS")
+
+
+def load_impact_weights(path=None):
+    # {item id: weight}: the built-in weights with `path`'s on top
+    weights = dict(IMPACT_WEIGHTS)
+    path = path or IMPACT_WEIGHTS_PATH
+    if path:
+        with open(path) as f:
+            overrides = json.load(f)
+        for item_id, weight in overrides.items():
+            item_id, weight = int(item_id), float(weight)
+            if item_id not in ITEMS_BY_ID:
+                raise ValueError(f"{path}: no checklist item has id {item_id}")
+            if weight < 0:
+                raise ValueError(f"{path}: item {item_id} has a negative weight")
+            weights[item_id] = weight
+    return weights
+
+
+def get_checklist(event_type):
+    return CHECKLISTS.get(event_type, CHECKLISTS["Other Corporate Event"])
+
+
+def is_set(mask, item_id):
+    return bool(mask >> item_id & 1)
+
+
+def set_bit(mask, item_id, value):
+    if value:
+        return mask | 1 << item_id
+    return mask & ~(1 << item_id)
+
+
+def record_state(record, checklist):
+    # (implemented, na) masks for a stored record, limited to the items that
+    # currently belong to this event type. Records saved before the catalog
+    # was versioned hold per-category lists of [text, implemented, na, tip];
+    # those are matched to items by text, not by position.
+    if record is None:
+        return 0, 0
+    if "catalog_version" in record:
+        return record["implemented"] & checklist.mask, record["na"] & checklist.mask
+    return _legacy_state(record.get("checklist", {}), checklist)
+
+
+def _other_state(record, checklist):
+    # (implemented, na) bits a record holds for items outside this event
+    # type, e.g. ticked before its type was changed. They are kept in the
+    # saved record, so switching the type back restores them, and only
+    # masked off when scoring and rendering.
+    if record is None or "catalog_version" not in record:
+        return 0, 0
+    return record["implemented"] & ~checklist.mask, record["na"] & ~checklist.mask
+
+
+def _legacy_state(saved_checklist, checklist):
+    by_text = {}
+    for item in checklist.items:
+        by_text.setdefault((item.category, item.text), item)
+        by_text.setdefault((None, item.text), item)
+    implemented = na = 0
+    for category, saved_items in saved_checklist.items():
+        for saved in saved_items:
+            item = by_text.get((category, saved[0])) or by_text.get((None, saved[0]))
+            if item is None:
+                continue
+            implemented = set_bit(implemented, item.id, saved[1])
+            na = set_bit(na, item.id, saved[2])
+    return implemented, na
+
+
+def record_identity(event_id, record):
+    # (event_type, event_date) of a stored event; older records only carry
+    # them in the "<event type>_<date>" id
+    if record is not None and "event_type" in record:
+        return record["event_type"], record["event_date"]
+    event_type, _, event_date = event_id.rpartition("_")
+    return event_type, event_date
+
+
+def make_record(event_type, event_date, implemented, na, custom_measures, date, name="", owner=""):
+    return {
+        "catalog_version": CATALOG_VERSION,
+        "event_type": event_type,
+        "event_date": event_date,
+        "name": name,
+        "owner": owner,
+        "implemented": implemented,
+        "na": na,
+        "custom_measures": custom_measures,
+        "date": date,
+    }
+
+
+def record_name(event_id, record):
+    # Display name; events saved before names existed are called after
+    # their type and date
+    if record is not None and record.get("name"):
+        return record["name"]
+    event_type, event_date = record_identity(event_id, record)
+    return f"{event_type} {event_date}"
+
+
+def updated_record(previous, event_type, event_date, implemented, na, custom_measures, now):
+    # The record to save after an edit. The previous timestamp is kept when
+    # nothing changed, so an untouched event compares equal to what's stored
+    # and isn't written again.
+    checklist = get_checklist(event_type)
+    other_implemented, other_na = _other_state(previous, checklist)
+    record = make_record(
+        event_type, event_date,
+        implemented & checklist.mask | other_implemented, na & checklist.mask | other_na,
+        [list(m) for m in custom_measures], now,
+    )
+    if previous is not None:
+        record["name"] = previous.get("name", "")
+        record["owner"] = previous.get("owner", "")
+        unchanged = (
+            (event_type, event_date) == (previous.get("event_type"), previous.get("event_date"))
+            and (implemented, na) == record_state(previous, checklist)
+            and record["custom_measures"] == [list(m) for m in previous["custom_measures"]]
+        )
+        if unchanged:
+            record["date"] = previous["date"]
+    return record
+
+
+
+def rebase_record(base, mine, theirs):
+    # Re-apply the edits that turned `base` into `mine` on top of `theirs`,
+    # a newer version someone else saved: only the items and custom
+    # measures this edit touched take `mine`'s state, everything else keeps
+    # `theirs`
+    if theirs is None:
+        return mine
+    checklist = get_checklist(mine["event_type"])
+    base_implemented, base_na = record_state(base, checklist)
+    their_implemented, their_na = record_state(theirs, checklist)
+    their_other_implemented, their_other_na = _other_state(theirs, checklist)
+    changed_implemented = (base_implemented ^ mine["implemented"]) & checklist.mask
+    changed_na = (base_na ^ mine["na"]) & checklist.mask
+    return make_record(
+        mine["event_type"],
+        mine["event_date"],
+        (their_implemented & ~changed_implemented) | (mine["implemented"] & changed_implemented) | their_other_implemented,
+        (their_na & ~changed_na) | (mine["na"] & changed_na) | their_other_na,
+        _rebase_measures(base["custom_measures"] if base is not None else [], mine["custom_measures"], theirs["custom_measures"]),
+        mine["date"],
+        mine.get("name", ""),
+        mine.get("owner", ""),
+    )
+
+
+def _rebase_measures(base, mine, theirs):
+    # Custom measures are matched by their normalized text: measures this
+    # edit added or changed are set on `theirs`, ones it removed are taken
+    # out of it, and the rest of `theirs` is left alone
+    base_by_key = {normalize(measure[0]): measure for measure in base}
+    mine_by_key = {normalize(measure[0]): measure for measure in mine}
+    changed = {key: measure for key, measure in mine_by_key.items() if base_by_key.get(key) != measure}
+    removed = base_by_key.keys() - mine_by_key.keys()
+    merged = []
+    for measure in theirs:
+        key = normalize(measure[0])
+        if key in removed:
+            continue
+        merged.append(changed.pop(key, measure))
+    # Changes to measures `theirs` removed are dropped with them; additions
+    # are kept
+    merged.extend(measure for key, measure in changed.items() if key not in base_by_key)
+    return merged
+
+
+# Flat row layout for exporting stored state to CSV; masks are written as
+# hex strings because they don't fit in 64-bit integer columns
+STATE_FIELDS = ("event_id", "event_type", "event_date", "name", "owner", "catalog_version", "implemented", "na", "custom_measures", "date")
+
+
+def record_to_row(event_id, record):
+    event_type, event_date = record_identity(event_id, record)
+    implemented, na = record_state(record, get_checklist(event_type))
+    return {
+        "event_id": event_id,
+        "event_type": event_type,
+        "event_date": event_date,
+        "name": record.get("name", ""),
+        "owner": record.get("owner", ""),
+        "catalog_version": record.get("catalog_version", CATALOG_VERSION),
+        "implemented": hex(implemented),
+        "na": hex(na),
+        "custom_measures": json.dumps(record.get("custom_measures", [])),
+        "date": record.get("date"),
+    }
+
+
+def row_to_record(row):
+    record = make_record(
+        row["event_type"],
+        row["event_date"],
+        int(row["implemented"], 16),
+        int(row["na"], 16),
+        json.loads(row["custom_measures"] or "[]"),
+        row["date"],
+        row.get("name", ""),
+        row.get("owner", ""),
+    )
+    record["catalog_version"] = int(row["catalog_version"])
+    return row["event_id"], record
+
@@ -1,13 +1,16 @@
 import streamlit as st
-import pandas as pd
-import json
-from datetime import datetime
+import inspect
+import shlex
+from datetime import date, datetime
+from functools import wraps
 
 # Set page config for green theme
 st.set_page_config(page_title="Corporate Eco-Event Scorer", page_icon="🌿", layout="wide")
 
-# Custom CSS for green and white theme with icons
-st.markdown("""
+# Custom CSS for green and white theme with icons. Streamlit clears any
+# element a rerun doesn't emit again, so this goes out on every run; it is a
+# constant, sent as raw HTML rather than through the markdown renderer
+APP_CSS = """
 <style>
     .reportview-container { background-color: #f0f8f0; }
     .sidebar .sidebar-content { background-color: #e0f0e0; }
@@ -26,27 +29,100 @@ st.markdown("""
     .not-implemented { color: #f44336; }
     .not-applicable { color: #9e9e9e; }
 </style>
-""", unsafe_allow_html=True)
-
-# Load and save functions for progress tracking
-import json
-
-def load_progress():
-    try:
-        with open("progress.json", "r") as f:
-            content = f.read()
-            if not content.strip():
-                return {}  # Return empty dict if file is empty
-            return json.loads(content)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}  # Return empty dict if file is not found or has invalid JSON
-def save_progress(data):
-    with open("progress.json", "w") as f:
-        json.dump(data, f)
+"""
+st.html(APP_CSS)
+
+# Load and save functions for progress tracking. numpy and pandas are only
+# imported by the pages that need them (see scoring.py), so a cold start
+# doesn't wait for them
+import aggregates
+import history
+import metrics
+import reports
+from catalog import EVENT_TYPES, get_checklist, is_set, make_record, record_identity, record_name, record_state, set_bit, updated_record
+from scoring import ImpactWeights, score_event, score_store, summarize, top_suggestions, weighted_score
+from measures import MeasureIndex, normalize
+from persister import WriteBehind
+from registry import EventRegistry, new_event_id
+from storage import DEFAULT_STORE_PATH, ConflictError, ProgressSession, open_store
+
+@st.cache_resource
+def get_store(path=DEFAULT_STORE_PATH):
+    # One store per process, shared by every browser session
+    return aggregates.attach(open_store(path))
+
+@st.cache_resource
+def get_persister():
+    # Saves are queued and written by a background thread, so a click never
+    # waits on disk; everything queued is flushed when the server exits
+    return WriteBehind(get_store())
+
+@st.cache_resource
+def get_registry():
+    # Indexes every stored event for the sidebar picker; built once per
+    # process and kept current as events are saved
+    return EventRegistry(get_store())
+
+@st.cache_resource
+def get_measures():
+    # Every event's custom measures, deduplicated, for suggestions as a
+    # measure is typed; kept current as events are saved
+    return MeasureIndex(get_store())
+
+@st.cache_resource
+def get_impact_weights():
+    # Per-event-type weight vectors, built on first use; restart the app to
+    # pick up a changed ECO_IMPACT_WEIGHTS file
+    return ImpactWeights()
+
+@st.cache_resource
+def get_history():
+    # Revision log of every save; has to exist before the first save
+    # so no change is missed
+    return history.attach(get_store())
+
+# Hot-path timing; a no-op unless metrics are enabled (see metrics.py)
+timed = metrics.registry.timed
+
+@timed("load_progress")
+def load_progress(event_id):
+    # Only the selected event is held by the session; the rest stay in the
+    # store's shared cache. Picks up other users' saves of this event as
+    # long as this session has nothing unsaved.
+    session = st.session_state.progress_session
+    record = session.open(event_id)
+    if st.session_state.get("widgets_loads") != session.loads:
+        reset_widgets(event_id)
+        st.session_state.widgets_loads = session.loads
+    return record
+
+def reset_widgets(event_id):
+    # A checkbox's key is its identity: once it has state, its value=
+    # argument is ignored. After another user's save is loaded, drop the
+    # event's checkbox states so they are seeded again from the new record
+    # instead of being saved back over it as this session's edits.
+    prefixes = (f"{event_id}_item_", f"{event_id}_custom_")
+    for key in [key for key in st.session_state if str(key).startswith(prefixes)]:
+        del st.session_state[key]
+
+def state_checkbox(label, key, value):
+    # Seeded with `value` only when the widget has no state yet (see
+    # reset_widgets)
+    st.session_state.setdefault(key, value)
+    return st.checkbox(label, key=key)
+
+@timed("save_progress")
+def save_progress(event_id, record):
+    # Returns False if someone else saved this event first; the session has
+    # then been reloaded with their version
+    session = st.session_state.progress_session
+    session.update(record)
+    return session.save()
 
 # Initialize session state
-if 'progress' not in st.session_state:
-    st.session_state.progress = load_progress()
+if 'progress_session' not in st.session_state:
+    get_history()
+    st.session_state.progress_session = ProgressSession(get_store(), get_persister())
 
 def main():
     st.title("🌿 Corporate Eco-Event Scorer")
@@ -59,60 +135,65 @@ def main():
     Created by Mark Kirkpatrick (mark.kirkpatrick@aecom.com)
     """)
 
-    # Event Type Selection
-    event_types = [
-        "Conference or Seminar",
-        "Board Meeting",
-        "Team Building Event",
-        "Product Launch",
-        "Annual General Meeting",
-        "Trade Show or Exhibition",
-        "Corporate Party or Celebration",
-        "Other Corporate Event"
-    ]
-    selected_event_type = st.selectbox("Select your corporate event type:", event_types)
-
-    # Unique identifier for the event
-    event_date = st.date_input("Event Date")
-    event_id = f"{selected_event_type}_{event_date}"
+    event_id = select_event()
+    if event_id is None:
+        st.info("Create an event, or pick one, in the sidebar to get started.")
+        display_import()
+        display_contact()
+        return
+
+    # Load previous progress; saved state is matched to items by id
+    previous = load_progress(event_id)
+    stored_type, stored_date = record_identity(event_id, previous)
+    st.subheader(record_name(event_id, previous))
+    if previous is not None and previous.get("owner"):
+        st.caption(f"Owner: {previous['owner']}")
+
+    # Type and date are details of the event rather than its identity, so
+    # they can be corrected here
+    selected_event_type = st.selectbox(
+        "Select your corporate event type:", EVENT_TYPES,
+        index=EVENT_TYPES.index(stored_type) if stored_type in EVENT_TYPES else len(EVENT_TYPES) - 1,
+        key=f"{event_id}_type",
+    )
+    event_date = st.date_input("Event Date", value=parse_date(stored_date), key=f"{event_id}_date")
 
     # Load checklist based on event type
     checklist = load_checklist(selected_event_type)
 
-    # Load previous progress if it exists
-    if event_id in st.session_state.progress:
-        saved_checklist = st.session_state.progress[event_id]['checklist']
-        # Merge saved progress with current checklist
-        for category in checklist:
-            for i, item in enumerate(checklist[category]):
-                if category in saved_checklist and i < len(saved_checklist[category]):
-                    checklist[category][i] = (item[0], saved_checklist[category][i][1], saved_checklist[category][i][2], item[3])
-        custom_measures = st.session_state.progress[event_id]['custom_measures']
-    else:
-        custom_measures = []
+    implemented, na = record_state(previous, checklist)
+    custom_measures = list(previous['custom_measures']) if previous is not None else []
 
     # Sidebar for navigation
-    page = st.sidebar.radio("Navigate", ["Checklist", "Custom Measures", "Results", "Eco-Tips", "Resources"])
+    page = st.sidebar.radio("Navigate", ["Checklist", "Custom Measures", "Results", "History", "Portfolio", "Reports", "Import", "Eco-Tips", "Resources"])
 
     if page == "Checklist":
-        checklist = display_checklist(checklist)
+        implemented, na = display_checklist(checklist, str(event_date))
     elif page == "Custom Measures":
-        custom_measures = display_custom_measures(custom_measures)
+        custom_measures = display_custom_measures(checklist, str(event_date))
     elif page == "Results":
-        display_results(checklist, custom_measures, selected_event_type)
+        display_results(checklist, implemented, na, custom_measures, selected_event_type)
+    elif page == "History":
+        display_history(event_id, selected_event_type)
+    elif page == "Portfolio":
+        display_portfolio()
+    elif page == "Reports":
+        display_reports()
+    elif page == "Import":
+        display_import()
     elif page == "Eco-Tips":
         display_eco_tips(selected_event_type)
     else:
         display_resources()
 
-    # Save progress
-    st.session_state.progress[event_id] = {
-        'checklist': checklist,
-        'custom_measures': custom_measures,
-        'date': str(datetime.now())
-    }
-    save_progress(st.session_state.progress)
+    # Checklist and custom measure edits are saved by their fragments as
+    # they happen; this creates the record for a new event and is a no-op
+    # when nothing changed
+    save_event(selected_event_type, str(event_date), implemented, na, custom_measures)
+
+    display_contact()
 
+def display_contact():
     # Contact information
     st.sidebar.markdown("---")
     st.sidebar.subheader("Feedback & Suggestions")
@@ -120,335 +201,568 @@ def main():
     If you have any suggestions or feedback, please email Mark Kirkpatrick at mark.kirkpatrick@aecom.com.
     """)
 
-def display_checklist(checklist):
+# How many events the picker lists at once; search or filter to narrow it
+PICKER_LIMIT = 200
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return date.today()
+
+def create_event(name, owner, event_type, event_date):
+    # Written straight away rather than queued, so the picker lists it on
+    # this rerun
+    event_id = new_event_id()
+    record = make_record(event_type, event_date, 0, 0, [], str(datetime.now()), name, owner)
+    get_store().put(event_id, record, 0)
+    return event_id
+
+def select_event():
+    # Sidebar picker over the event registry; returns the selected event's
+    # id, or None while there are no events
+    registry = get_registry()
+    st.sidebar.header("Events")
+    with st.sidebar.expander("New event"):
+        with st.form("new_event", clear_on_submit=True):
+            name = st.text_input("Event name")
+            owner = st.text_input("Owner")
+            event_type = st.selectbox("Event type", EVENT_TYPES)
+            event_date = st.date_input("Event date")
+            if st.form_submit_button("Create event"):
+                if name.strip():
+                    st.session_state.event_id = create_event(name.strip(), owner.strip(), event_type, str(event_date))
+                else:
+                    st.warning("Give the event a name.")
+
+    query = st.sidebar.text_input("Search events by name or owner")
+    with st.sidebar.expander("Filters"):
+        event_types = st.multiselect("Event types", EVENT_TYPES)
+        dates = st.date_input("Event dates", value=(), key="picker_dates")
+        min_score, max_score = st.slider("Score", 0, 100, (0, 100), step=10)
+    start_date = dates[0] if len(dates) > 0 else None
+    end_date = dates[1] if len(dates) > 1 else start_date
+    score_filter = (min_score, max_score) != (0, 100)
+    entries = registry.search(
+        query, event_types, start_date, end_date,
+        min_score if score_filter else None, max_score if score_filter else None,
+        limit=PICKER_LIMIT,
+    )
+
+    # Keep the open event selectable even when it's filtered out
+    current = st.session_state.get("event_id")
+    current_entry = registry.get(current) if current else None
+    if current_entry is not None and current_entry not in entries:
+        entries.insert(0, current_entry)
+    if not entries:
+        if len(registry):
+            st.sidebar.info("No events match.")
+        return None
+    labels = {entry.event_id: f"{entry.name} · {entry.event_date} · {entry.score:.0f}%" for entry in entries}
+    event_ids = list(labels)
+    event_id = st.sidebar.selectbox(
+        f"Event (first {PICKER_LIMIT} shown)" if len(entries) >= PICKER_LIMIT else "Event",
+        event_ids,
+        index=event_ids.index(current) if current in labels else 0,
+        format_func=labels.get,
+    )
+    st.session_state.event_id = event_id
+    return event_id
+
+# A fragment reruns on its own when one of its widgets changes, without
+# rerunning the rest of the page; older Streamlit versions render the
+# functions as part of the full page instead
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
+def collected(func):
+    # A fragment rerun skips the metrics run entered around main(), so
+    # enter one again for ?debug=1 sessions; within a full rerun this just
+    # joins the page's run
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with metrics.registry.run(debug_requested()):
+            return func(*args, **kwargs)
+    return wrapper
+
+def current_state(checklist):
+    # The session's latest state for the selected event, including any
+    # changes fragments have saved since the page last ran
+    record = st.session_state.progress_session.record
+    implemented, na = record_state(record, checklist)
+    custom_measures = [tuple(m) for m in record['custom_measures']] if record is not None else []
+    return implemented, na, custom_measures
+
+def save_event(event_type, event_date, implemented, na, custom_measures):
+    session = st.session_state.progress_session
+    record = updated_record(session.record, event_type, event_date, implemented, na, custom_measures, str(datetime.now()))
+    if not save_progress(session.event_id, record):
+        metrics.registry.incr("save_conflicts")
+        st.warning("Someone else updated this event at the same time. Their changes have been loaded; please re-apply yours.")
+
+@timed("render_checklist")
+def display_checklist(checklist, event_date):
     st.header("Eco-Friendly Checklist")
-    for category, items in checklist.items():
-        st.subheader(category)
-        for i, item in enumerate(items):
-            key = f"{category}_{i}"
-            col1, col2, col3 = st.columns([3, 1, 1])
-            with col1:
-                st.markdown(f"{item[0]} <div class='tooltip'>ℹ️<span class='tooltiptext'>{item[3]}</span></div>", unsafe_allow_html=True)
-            with col2:
-                implemented = st.checkbox("Implemented", value=item[1], key=f"{key}_implemented")
-            with col3:
-                not_applicable = st.checkbox("N/A", value=item[2], key=f"{key}_na")
-            
-            # Visual feedback
-            if implemented:
-                st.markdown('<span class="icon implemented">✔️</span>', unsafe_allow_html=True)
-            elif not_applicable:
-                st.markdown('<span class="icon not-applicable">➖</span>', unsafe_allow_html=True)
-            else:
-                st.markdown('<span class="icon not-implemented">❌</span>', unsafe_allow_html=True)
-            
-            checklist[category][i] = (item[0], implemented, not_applicable, item[3])
-    return checklist
-
-def display_custom_measures(custom_measures):
+    for index in range(len(checklist.categories)):
+        display_category(checklist.event_type, event_date, index)
+    return current_state(checklist)[:2]
+
+@fragment
+@collected
+@timed("render_category")
+def display_category(event_type, event_date, index):
+    # Toggling an item reruns and saves only this category
+    checklist = load_checklist(event_type)
+    category, items = checklist.categories[index]
+    implemented_mask, na_mask, custom_measures = current_state(checklist)
+    event_id = st.session_state.progress_session.event_id
+    st.subheader(category)
+    new_implemented, new_na = implemented_mask, na_mask
+    for item in items:
+        key = f"{event_id}_item_{item.id}"
+        col1, col2, col3 = st.columns([3, 1, 1])
+        with col1:
+            st.markdown(f"{item.text} <div class='tooltip'>ℹ️<span class='tooltiptext'>{item.tip}</span></div>", unsafe_allow_html=True)
+        with col2:
+            implemented = state_checkbox("Implemented", f"{key}_implemented", is_set(implemented_mask, item.id))
+        with col3:
+            not_applicable = state_checkbox("N/A", f"{key}_na", is_set(na_mask, item.id))
+        
+        # Visual feedback
+        if implemented:
+            st.markdown('<span class="icon implemented">✔️</span>', unsafe_allow_html=True)
+        elif not_applicable:
+            st.markdown('<span class="icon not-applicable">➖</span>', unsafe_allow_html=True)
+        else:
+            st.markdown('<span class="icon not-implemented">❌</span>', unsafe_allow_html=True)
+        
+        new_implemented = set_bit(new_implemented, item.id, implemented)
+        new_na = set_bit(new_na, item.id, not_applicable)
+    if (new_implemented, new_na) != (implemented_mask, na_mask):
+        save_event(event_type, event_date, new_implemented, new_na, custom_measures)
+
+@timed("render_custom_measures")
+def display_custom_measures(checklist, event_date):
     st.header("Custom Eco-Friendly Measures")
-    new_measure = st.text_input("Add a custom eco-friendly measure:")
-    if st.button("Add Measure"):
-        if new_measure:
-            custom_measures.append((new_measure, False, False))
-            st.success(f"Added: {new_measure}")
+    display_add_measure(checklist.event_type, event_date)
+    added = st.session_state.pop("measure_added", None)
+    if added:
+        st.success(f"Added: {added}")
 
+    custom_measures = current_state(checklist)[2]
     if custom_measures:
         st.subheader("Your Custom Measures")
-        for i, (measure, implemented, not_applicable) in enumerate(custom_measures):
-            col1, col2, col3 = st.columns([3, 1, 1])
-            with col1:
-                st.write(measure)
-            with col2:
-                implemented = st.checkbox("Implemented", value=implemented, key=f"custom_{i}_implemented")
-            with col3:
-                not_applicable = st.checkbox("N/A", value=not_applicable, key=f"custom_{i}_na")
-            
-            # Visual feedback
-            if implemented:
-                st.markdown('<span class="icon implemented">✔️</span>', unsafe_allow_html=True)
-            elif not_applicable:
-                st.markdown('<span class="icon not-applicable">➖</span>', unsafe_allow_html=True)
-            else:
-                st.markdown('<span class="icon not-implemented">❌</span>', unsafe_allow_html=True)
-            
-            custom_measures[i] = (measure, implemented, not_applicable)
-    return custom_measures
-
-def display_results(checklist, custom_measures, event_type):
+        for index in range(len(custom_measures)):
+            display_custom_measure(checklist.event_type, event_date, index)
+    return current_state(checklist)[2]
+
+# How many measures from other events are suggested at once
+SUGGESTION_LIMIT = 5
+
+# Suggestions follow the text as it's typed where Streamlit supports it;
+# older versions update them on Enter
+LIVE_INPUT = {"live": True} if "live" in inspect.signature(st.text_input).parameters else {}
+
+@fragment
+@collected
+def display_add_measure(event_type, event_date):
+    # Typing reruns only this fragment; adding a measure reruns the page so
+    # the list below shows it
+    new_measure = st.text_input("Add a custom eco-friendly measure:", **LIVE_INPUT)
+    implemented, na, custom_measures = current_state(load_checklist(event_type))
+    own = {normalize(measure[0]) for measure in custom_measures}
+    chosen = new_measure.strip() if st.button("Add Measure") else None
+
+    suggestions = get_measures().suggest(new_measure, SUGGESTION_LIMIT, exclude=own)
+    if suggestions:
+        st.caption("Used by other events:")
+        for suggestion in suggestions:
+            label = f"{suggestion.text} · {suggestion.events} event{'s' if suggestion.events != 1 else ''}"
+            if st.button(label, key=f"suggested_{suggestion.key}"):
+                chosen = suggestion.text
+
+    if not chosen:
+        return
+    if normalize(chosen) in own:
+        st.warning(f"{chosen} is already one of this event's measures.")
+        return
+    save_event(event_type, event_date, implemented, na, custom_measures + [(chosen, False, False)])
+    st.session_state.measure_added = chosen
+    st.rerun()
+
+@fragment
+@collected
+def display_custom_measure(event_type, event_date, index):
+    # Toggling a measure reruns and saves only its own row
+    implemented_mask, na_mask, custom_measures = current_state(load_checklist(event_type))
+    if index >= len(custom_measures):
+        return
+    measure, implemented, not_applicable = custom_measures[index]
+    key = f"{st.session_state.progress_session.event_id}_custom_{index}"
+    col1, col2, col3 = st.columns([3, 1, 1])
+    with col1:
+        st.write(measure)
+    with col2:
+        implemented = state_checkbox("Implemented", f"{key}_implemented", implemented)
+    with col3:
+        not_applicable = state_checkbox("N/A", f"{key}_na", not_applicable)
+    
+    # Visual feedback
+    if implemented:
+        st.markdown('<span class="icon implemented">✔️</span>', unsafe_allow_html=True)
+    elif not_applicable:
+        st.markdown('<span class="icon not-applicable">➖</span>', unsafe_allow_html=True)
+    else:
+        st.markdown('<span class="icon not-implemented">❌</span>', unsafe_allow_html=True)
+    
+    if (measure, implemented, not_applicable) != custom_measures[index]:
+        custom_measures[index] = (measure, implemented, not_applicable)
+        save_event(event_type, event_date, implemented_mask, na_mask, custom_measures)
+
+# How many of the highest-impact missing items the Results page suggests
+TOP_SUGGESTIONS = 5
+
+@timed("render_results")
+def display_results(checklist, implemented_mask, na_mask, custom_measures, event_type):
     st.header(f"Results for {event_type}")
+    weighted = st.checkbox("Weight measures by their environmental impact", key="impact_weighted")
 
     # Calculate score
-    total_applicable = 0
-    implemented = 0
-    for items in checklist.values():
-        for item in items:
-            if not item[2]:  # If not marked as N/A
-                total_applicable += 1
-                if item[1]:  # If implemented
-                    implemented += 1
-    
-    for measure in custom_measures:
-        if not measure[2]:  # If not marked as N/A
-            total_applicable += 1
-            if measure[1]:  # If implemented
-                implemented += 1
-
-    score = (implemented / total_applicable * 100) if total_applicable > 0 else 100
+    implemented, total_applicable, score = score_event(event_type, implemented_mask, na_mask, custom_measures)
+    weights = get_impact_weights()
+    impact = weighted_score(event_type, implemented_mask, na_mask, custom_measures, weights)
 
     # Display score with a progress bar
     st.subheader("Your Event's Eco-Score")
-    st.progress(score / 100)
-    st.write(f"Score: {score:.2f}%")
+    st.progress((impact.score if weighted else score) / 100)
+    if weighted:
+        st.write(f"Impact-weighted score: {impact.score:.2f}% ({impact.implemented:g} of {impact.applicable:g} impact points)")
+        st.caption(f"Unweighted score: {score:.2f}%")
+    else:
+        st.write(f"Score: {score:.2f}%")
     st.write(f"Implemented measures: {implemented} out of {total_applicable} applicable measures")
 
-    # Comparison feature (mock data - you'd need to implement actual data collection)
-    avg_score = 75  # This would be calculated based on real data
+    # Comparison against every saved event of this type, from the running aggregates
+    stats = aggregates.type_stats(get_store(), event_type)
     st.subheader("Score Comparison")
-    st.write(f"Your score: {score:.2f}%")
-    st.write(f"Average score for {event_type}: {avg_score:.2f}%")
-    if score > avg_score:
-        st.success(f"Great job! Your event is {score - avg_score:.2f}% more eco-friendly than average.")
+    st.write(f"Your score: {score:.2f}%" + (" (unweighted, like the averages)" if weighted else ""))
+    if stats is None:
+        st.info(f"No saved {event_type} events to compare with yet.")
     else:
-        st.info(f"There's room for improvement. Your event is {avg_score - score:.2f}% less eco-friendly than average.")
-
-    # Provide suggestions
-    if score < 100:
+        avg_score = stats.mean_score
+        st.write(f"Average score for {event_type}: {avg_score:.2f}% (median {stats.median_score:.2f}%, across {stats.events} events)")
+        st.write(f"Percentile rank: {aggregates.percentile_rank(stats, score):.0f}")
+        if score > avg_score:
+            st.success(f"Great job! Your event is {score - avg_score:.2f}% more eco-friendly than average.")
+        else:
+            st.info(f"There's room for improvement. Your event is {avg_score - score:.2f}% less eco-friendly than average.")
+
+    # The missing items with the most impact, rather than every one of them
+    suggestions = top_suggestions(checklist.event_type, implemented_mask, na_mask, weights, TOP_SUGGESTIONS)
+    if score < 100 and suggestions:
         st.subheader("Suggestions for Improvement")
-        for category, items in checklist.items():
-            for item in items:
-                if not item[1] and not item[2]:  # If not implemented and not N/A
-                    st.write(f"- Consider implementing: {item[0]}")
-                    st.write(f"  *Tip: {item[3]}*")
+        for item, weight in suggestions:
+            gain = weight * 100 / impact.applicable if weighted else 100 / total_applicable
+            st.write(f"- Consider implementing: {item.text} (+{gain:.1f} points)")
+            st.write(f"  *Tip: {item.tip}*")
+        remaining = bin(checklist.mask & ~(implemented_mask | na_mask)).count("1") - len(suggestions)
+        if remaining > 0:
+            st.caption(f"{remaining} more measures not yet implemented are on the Checklist page.")
+
+@timed("render_history")
+def display_history(event_id, event_type):
+    st.header("Score History")
+    log = get_history()
+    dates = st.date_input("Period", value=(), key="history_dates")
+    start = dates[0] if len(dates) > 0 else None
+    end = dates[1] if len(dates) > 1 else None
+
+    st.subheader("This event")
+    scores = log.event_scores(event_id, start, end)
+    if scores.empty:
+        st.info("No changes recorded for this event in this period.")
+    else:
+        st.line_chart(scores["score"])
+        st.caption(f"{len(scores)} saved changes")
+
+    st.subheader(f"All {event_type} events")
+    totals = log.type_scores(event_type, start, end)
+    if totals.empty:
+        st.info(f"No changes recorded for {event_type} events in this period.")
+    else:
+        # Average score at the end of each day
+        daily = totals["mean_score"].resample("D").last().ffill()
+        st.line_chart(daily.rename("average score"))
+
+@timed("render_portfolio")
+def display_portfolio():
+    st.header("Portfolio Overview")
+    # Impact-weighted scores are one more matrix product over the same batch
+    scores = score_store(get_store(), get_impact_weights())
+    if scores.empty:
+        st.info("No events have been saved yet.")
+        return
+
+    st.write(
+        f"{len(scores)} events, average score {scores['score'].mean():.2f}% "
+        f"({scores['weighted_score'].mean():.2f}% impact-weighted)"
+    )
+    st.subheader("By Event Type")
+    st.dataframe(summarize(scores, ["event_type"]))
+    st.subheader("By Month")
+    scores["month"] = scores["month"].dt.strftime("%Y-%m")
+    st.dataframe(summarize(scores, ["month", "event_type"]))
+
+REPORT_FORMATS = {"csv": "CSV", "jsonl": "JSON Lines", "html": "HTML", "md": "Markdown"}
+
+# Streamlit holds a download in memory while serving it, so larger reports
+# are left to reports.py, which streams to a file
+REPORT_DOWNLOAD_LIMIT = 20000
+
+def report_command(store, output_format, start, end, event_types, weighted):
+    # The reports.py command line for the page's selection
+    command = ["python", "reports.py", store.path, f"eco-event-report.{output_format}"]
+    if start:
+        command += ["--start", str(start), "--end", str(end)]
+    for event_type in event_types:
+        command += ["--type", event_type]
+    if weighted:
+        command.append("--weighted")
+    return shlex.join(command)
+
+@timed("render_reports")
+def display_reports():
+    st.header("Reports")
+    st.markdown("""
+    Download the results of every saved event in a period: scores, the highest-impact measures each
+    event is missing and totals per event type. CSV holds the events only; the other formats end
+    with the totals. Reports of more than {limit:,} events are exported with `reports.py`.
+    """.format(limit=REPORT_DOWNLOAD_LIMIT))
+    dates = st.date_input("Event dates (leave empty for all)", value=(), key="report_dates")
+    event_types = st.multiselect("Event types (leave empty for all)", EVENT_TYPES, key="report_types")
+    output_format = st.selectbox("Format", list(REPORT_FORMATS), format_func=REPORT_FORMATS.get, key="report_format")
+    weighted = st.checkbox("Include impact-weighted scores", key="report_weighted")
+    start = dates[0] if len(dates) > 0 else None
+    end = dates[1] if len(dates) > 1 else start
+    store = get_store()
+
+    selected = get_registry().search(event_types=event_types, start_date=start, end_date=end, limit=REPORT_DOWNLOAD_LIMIT + 1)
+    if len(selected) > REPORT_DOWNLOAD_LIMIT:
+        st.info(
+            f"This selection has more than {REPORT_DOWNLOAD_LIMIT:,} events, too many to download here. "
+            "Export it from the command line instead:"
+        )
+        st.code(report_command(store, output_format, start, end, event_types, weighted), language="bash")
+        return
+
+    def build():
+        # Only runs when the button is clicked, on its own thread. Streamlit
+        # keeps the whole report in memory while serving it, hence the limit
+        # above.
+        return reports.report_bytes(store, output_format, start, end, event_types, weighted)
+
+    st.download_button(
+        "Download report", build, file_name=f"eco-event-report.{output_format}", mime=reports.MIME_TYPES[output_format],
+    )
+
+@timed("render_import")
+def display_import():
+    st.header("Import Events")
+    st.markdown("""
+    Upload a CSV or Excel sheet with one row per event and columns for the event type and date,
+    optionally an event_id, name and owner, one column per checklist item (named after the item)
+    and `custom:<measure>` columns for custom measures. Cells say yes, no or n/a.
+    Rows with the event_id of an existing event replace it.
+    """)
+    upload = st.file_uploader("Spreadsheet", type=["csv", "xlsx"])
+    if upload is None:
+        return
+    # Loaded on the first upload rather than with the page
+    import pandas as pd
+    import importer
+
+    try:
+        first = next(importer.read_chunks(upload, chunk_size=1, filename=upload.name), None)
+    except Exception as error:
+        st.error(f"Could not read {upload.name}: {error}")
+        return
+    if first is None:
+        st.error(f"{upload.name} has no header row.")
+        return
+
+    # Columns are matched automatically; anything can be remapped by hand
+    mapping = importer.auto_mapping(first.columns)
+    edited = st.data_editor(
+        pd.DataFrame({"column": list(mapping), "maps to": [target or "" for target in mapping.values()]}),
+        disabled=["column"], hide_index=True, key=f"import_mapping_{upload.file_id}",
+    )
+    mapping = {column: target.strip() or None for column, target in zip(edited["column"], edited["maps to"])}
+    problems = importer.check_mapping(mapping)
+    for problem in problems:
+        st.error(problem)
+    skip_invalid = st.checkbox("Import the valid rows even if some rows are invalid")
+    if problems or not st.button("Import"):
+        return
+
+    upload.seek(0)
+    with st.spinner("Checking every row..."):
+        result = importer.prepare(importer.read_chunks(upload, filename=upload.name), mapping)
+    if result.errors:
+        st.dataframe(pd.DataFrame(result.errors, columns=["row", "column", "problem"]), hide_index=True)
+    if result.ignored_cells:
+        st.info(f"{result.ignored_cells} cells were for items that aren't on their event type's checklist and were ignored.")
+    if result.error_count and not skip_invalid:
+        st.error(f"{result.error_count} of {result.rows} rows are invalid; nothing was imported.")
+        return
+    with st.spinner(f"Saving {len(result.records)} events..."):
+        try:
+            importer.write(get_store(), result.records)
+        except ConflictError:
+            st.error("Some of these events were changed while importing; nothing was imported. Please try again.")
+            return
+    st.success(f"Imported {len(result.records)} events.")
 
 def display_eco_tips(event_type):
     st.header(f"Eco-Tips for {event_type}")
-    tips = load_eco_tips(event_type)
-    for tip in tips:
-        st.markdown(f"• {tip}")
+    st.markdown(ECO_TIPS_MARKDOWN[event_type])
 
 def display_resources():
     st.header("Resources for Eco-Friendly Corporate Events")
-    resources = [
-        {"name": "Sustainable event planning - Berlin Convention Office", "url": "https://convention.visitberlin.de/en/sustainable-event-planning"},
-        {"name": "The Importance of Eco-Friendly Events and How to Plan Them - Events Made Simple", "url": "https://www.eventsmadesimple.co.uk/the-importance-of-eco-friendly-events-and-how-to-plan-them/"},
-        {"name": "Sustainability Tracking Software - Momentus Technologies", "url": "https://gomomentus.com/"},
-        {"name": "Sustainable Event Planning: Beyond the Basics - The Event Planner Expo", "url": "https://www.theeventplannerexpo.com/sustainable-event-planning-beyond-the-basics/"},
-        {"name": "10 Green Event Ideas That Can Make a Huge Difference - Cvent Blog", "url": "https://www.cvent.com/en/blog/events/green-event-ideas"},
-    ]
-    for resource in resources:
-        st.markdown(f"• [{resource['name']}]({resource['url']})")
+    st.markdown(RESOURCES_MARKDOWN)
 
+@timed("load_checklist")
 def load_checklist(event_type):
-    # Common checklist items for all event types
-    common_checklist = {
-        "Venue Selection": [
-            ("Choose a venue with green certifications", False, False, "Look for LEED, BREEAM, or other sustainability certifications."),
-            ("Select a location accessible by public transport", False, False, "This reduces the carbon footprint of attendee travel."),
-            ("Opt for venues with natural lighting", False, False, "This can significantly reduce energy consumption."),
-            ("Choose a venue with efficient HVAC systems", False, False, "This can significantly reduce energy consumption for heating and cooling.")
-        ],
-        "Energy and Water": [
-            ("Use energy-efficient lighting and equipment", False, False, "LED lights and Energy Star certified equipment can greatly reduce energy use."),
-            ("Implement water-saving measures", False, False, "Use low-flow faucets and toilets, and avoid bottled water."),
-            ("Offset energy use with renewable energy credits", False, False, "This can help neutralize your event's carbon footprint."),
-            ("Use smart power strips and timers", False, False, "This can help reduce standby power consumption.")
-        ],
-        "Waste Management": [
-            ("Provide clearly labeled recycling and composting bins", False, False, "Make it easy for attendees to dispose of waste properly."),
-            ("Use digital materials instead of printed handouts", False, False, "This significantly reduces paper waste."),
-            ("Choose reusable or compostable serving ware", False, False, "Avoid single-use plastics and opt for sustainable alternatives."),
-            ("Partner with local recycling and composting facilities", False, False, "Ensure proper disposal of waste after the event.")
-        ],
-        "Food and Beverage": [
-            ("Offer plant-based and locally sourced food options", False, False, "This reduces the carbon footprint of your catering."),
-            ("Use bulk dispensers for beverages", False, False, "This eliminates the need for individual bottles or cans."),
-            ("Donate excess food to local charities", False, False, "This reduces food waste and supports the local community."),
-            ("Choose organic and fair trade options when possible", False, False, "This supports sustainable agriculture and fair labor practices.")
-        ],
-        "Transportation": [
-            ("Provide information on public transport options", False, False, "Encourage attendees to use eco-friendly transportation."),
-            ("Offer virtual attendance options", False, False, "This can significantly reduce travel-related emissions."),
-            ("Arrange shared transportation for off-site activities", False, False, "This is more efficient than individual transportation."),
-            ("Encourage carpooling among attendees", False, False, "Set up a carpooling system to reduce individual car use.")
-        ]
-    }
-
-    # Event-specific checklist items
-    event_specific_items = {
-        "Conference or Seminar": {
-            "Technology": [
-                ("Use energy-efficient audiovisual equipment", False, False, "Choose equipment with power-saving modes."),
-                ("Offer virtual attendance options", False, False, "This can significantly reduce travel-related emissions."),
-                ("Provide digital conference materials", False, False, "Use apps or websites instead of printed programs."),
-                ("Implement a conference app for networking", False, False, "This can reduce the need for printed business cards and schedules.")
-            ],
-            "Session Planning": [
-                ("Include sustainability-focused sessions", False, False, "Educate attendees about sustainability in your industry."),
-                ("Use interactive polling to reduce paper use", False, False, "Digital polling can engage attendees without wasting paper."),
-                ("Offer workshops on sustainable practices", False, False, "Provide practical sustainability skills to attendees.")
-            ]
-        },
-        "Board Meeting": {
-            "Paper Reduction": [
-                ("Use digital voting systems", False, False, "Eliminate paper ballots for board decisions."),
-                ("Implement paperless document sharing", False, False, "Use secure digital platforms for sharing confidential documents."),
-                ("Provide tablets or laptops for document viewing", False, False, "This eliminates the need for printed documents during the meeting.")],
-            "Meeting Efficiency": [
-                ("Use video conferencing for remote participants", False, False, "This reduces travel-related emissions."),
-                ("Implement a strict agenda to reduce meeting time", False, False, "Shorter meetings consume less energy."),
-                ("Choose energy-efficient meeting room equipment", False, False, "Use low-power projectors and screens.")
-            ]
-        },
-        "Team Building Event": {
-            "Sustainable Activities": [
-                ("Choose eco-friendly team building activities", False, False, "Consider activities like park clean-ups or sustainable craft workshops."),
-                ("Use reusable name tags and team identifiers", False, False, "Avoid disposable items for team identification."),
-                ("Opt for outdoor activities when possible", False, False, "This can reduce energy consumption for indoor spaces."),
-                ("Incorporate sustainability education into activities", False, False, "Use the event as an opportunity to teach about environmental issues.")
-            ],
-            "Eco-friendly Rewards": [
-                ("Offer sustainable prizes or rewards", False, False, "Choose eco-friendly or locally made items as prizes."),
-                ("Provide digital certificates of participation", False, False, "Avoid printing paper certificates."),
-                ("Plant trees or donate to environmental causes in participants' names", False, False, "This creates a lasting positive impact.")
-            ]
-        },
-        "Product Launch": {
-            "Sustainable Promotion": [
-                ("Use eco-friendly promotional materials", False, False, "Choose recyclable or plantable promotional items."),
-                ("Highlight the product's sustainability features", False, False, "Educate attendees about the product's environmental impact."),
-                ("Implement digital product demonstrations", False, False, "Use screens or AR/VR to showcase products instead of physical samples."),
-                ("Offer sustainable packaging options", False, False, "If products are distributed, use minimal, recyclable packaging.")
-            ],
-            "Venue Setup": [
-                ("Use modular, reusable booth designs", False, False, "This reduces waste from single-use displays."),
-                ("Implement energy-efficient lighting for product displays", False, False, "Use LED lights to highlight products."),
-                ("Create a recycling plan for promotional materials", False, False, "Ensure that any distributed materials can be easily recycled.")
-            ]
-        },
-        "Annual General Meeting": {
-            "Shareholder Engagement": [
-                ("Offer online participation options", False, False, "Reduce travel emissions by allowing remote attendance and voting."),
-                ("Provide sustainability reports digitally", False, False, "Avoid printing large reports by offering digital versions."),
-                ("Use an event app for agenda and voting", False, False, "This can replace printed materials and paper ballots."),
-                ("Stream the meeting live for remote shareholders", False, False, "This allows participation without travel.")
-            ],
-            "Sustainable Presentations": [
-                ("Use energy-efficient presentation equipment", False, False, "Choose projectors and screens with low power consumption."),
-                ("Provide digital access to all meeting documents", False, False, "Allow shareholders to view documents on their own devices."),
-                ("Include a sustainability progress report in the agenda", False, False, "Highlight the company's environmental initiatives.")
-            ]
-        },
-        "Trade Show or Exhibition": {
-            "Booth Design": [
-                ("Use sustainable materials for booth construction", False, False, "Choose recyclable or reusable booth materials."),
-                ("Implement energy-efficient lighting in booths", False, False, "Use LED lights and minimize unnecessary lighting."),
-                ("Design modular booth elements for reuse", False, False, "Create booth components that can be reconfigured for future events."),
-                ("Use digital displays instead of printed banners", False, False, "This allows for easy updates and reduces waste.")
-            ],
-            "Exhibitor Guidelines": [
-                ("Provide exhibitors with sustainability guidelines", False, False, "Encourage all exhibitors to follow eco-friendly practices."),
-                ("Offer incentives for sustainable booth designs", False, False, "Recognize and reward exhibitors who prioritize sustainability."),
-                ("Implement a waste reduction competition among exhibitors", False, False, "Encourage innovative ways to minimize waste."),
-                ("Facilitate booth material recycling post-event", False, False, "Provide clear guidelines and services for material disposal.")
-            ]
-        },
-        "Corporate Party or Celebration": {
-            "Sustainable Decorations": [
-                ("Use reusable or biodegradable decorations", False, False, "Avoid single-use plastic decorations."),
-                ("Choose local and seasonal flowers or plants", False, False, "Reduce transportation emissions and support local businesses."),
-                ("Implement energy-efficient mood lighting", False, False, "Use LED string lights or solar-powered options."),
-                ("Create decorations from recycled materials", False, False, "Engage employees in creating unique, sustainable decor.")
-            ],
-            "Entertainment": [
-                ("Choose local entertainers to reduce travel", False, False, "This supports the local community and reduces transportation emissions."),
-                ("Opt for acoustic performances when possible", False, False, "This can reduce energy use for sound systems."),
-                ("Implement a sustainability theme in activities", False, False, "Incorporate eco-friendly messages into party games or performances."),
-                ("Use digital photo booths instead of printed photos", False, False, "Allow guests to receive photos electronically.")
-            ]
-        }
-    }
-
-    # Combine common checklist with event-specific items
-    if event_type in event_specific_items:
-        common_checklist.update(event_specific_items[event_type])
-    
-    return common_checklist
-
-def load_eco_tips(event_type):
-    common_tips = [
-        "Use digital invitations and event materials to reduce paper waste.",
-        "Choose venues with natural lighting to reduce energy consumption.",
-        "Offer plant-based meal options to reduce the event's carbon footprint.",
-        "Use reusable name badges and collect them at the end of the event.",
-        "Partner with local, sustainable businesses for event services and supplies.",
-        "Implement a comprehensive recycling and composting program.",
-        "Educate attendees about the event's sustainability initiatives.",
-        "Choose venues that have strong sustainability policies in place.",
-        "Minimize swag and opt for useful, sustainable items if necessary.",
-        "Conduct a post-event sustainability assessment to improve future events."
+    # Compiled once at import by catalog.py; shared by every rerun
+    return get_checklist(event_type)
+
+# Static page content, built once at import and shared by every session
+COMMON_TIPS = [
+    "Use digital invitations and event materials to reduce paper waste.",
+    "Choose venues with natural lighting to reduce energy consumption.",
+    "Offer plant-based meal options to reduce the event's carbon footprint.",
+    "Use reusable name badges and collect them at the end of the event.",
+    "Partner with local, sustainable businesses for event services and supplies.",
+    "Implement a comprehensive recycling and composting program.",
+    "Educate attendees about the event's sustainability initiatives.",
+    "Choose venues that have strong sustainability policies in place.",
+    "Minimize swag and opt for useful, sustainable items if necessary.",
+    "Conduct a post-event sustainability assessment to improve future events."
+]
+
+EVENT_SPECIFIC_TIPS = {
+    "Conference or Seminar": [
+        "Encourage speakers to use digital presentations instead of handouts.",
+        "Set up a dedicated app for the conference to reduce printed materials.",
+        "Offer virtual attendance options to reduce travel-related emissions.",
+        "Implement a 'green speaker' certification for presenters who follow sustainable practices.",
+        "Organize networking sessions around sustainability themes."
+    ],
+    "Board Meeting": [
+        "Implement a bring-your-own-device policy to reduce the need for printing.",
+        "Use video conferencing for board members who can't attend in person.",
+        "Choose a meeting venue close to where most board members are based.",
+        "Provide reusable water bottles or glasses instead of disposable options.",
+        "Implement paperless voting systems for board decisions."
+    ],
+    "Team Building Event": [
+        "Choose outdoor locations to reduce energy consumption.",
+        "Incorporate sustainability challenges into team building activities.",
+        "Use eco-friendly materials for any team building supplies or equipment.",
+        "Partner with local environmental organizations for volunteer activities.",
+        "Provide sustainable transportation options for team members."
+    ],
+    "Product Launch": [
+        "Use virtual or augmented reality for product demonstrations to reduce physical waste.",
+        "Offer digital goodie bags instead of physical ones.",
+        "Highlight the product's sustainability features in the launch presentation.",
+        "Use energy-efficient lighting and sound systems for the event.",
+        "Implement a product packaging return or recycling program at the launch."
+    ],
+    "Annual General Meeting": [
+        "Provide digital voting options to reduce paper use.",
+        "Stream the meeting live for shareholders who can't attend in person.",
+        "Offer incentives for shareholders who choose digital over printed materials.",
+        "Include a presentation on the company's sustainability initiatives.",
+        "Choose a central, easily accessible location to minimize travel."
+    ],
+    "Trade Show or Exhibition": [
+        "Design modular, reusable booth elements to reduce waste.",
+        "Use QR codes for information sharing instead of printed brochures.",
+        "Implement a 'green exhibitor' certification program.",
+        "Organize a sustainability award for the most eco-friendly booth.",
+        "Provide centralized recycling stations throughout the exhibition area."
+    ],
+    "Corporate Party or Celebration": [
+        "Choose venues that support local communities and sustainable practices.",
+        "Opt for e-tickets or app-based guest lists instead of paper tickets.",
+        "Use locally-sourced, seasonal ingredients for catering.",
+        "Implement a zero-waste policy for the event.",
+        "Donate leftover food to local charities or food banks."
+    ],
+    "Other Corporate Event": [
+        "Consider the unique aspects of your event and how to make them more sustainable.",
+        "Engage employees in brainstorming eco-friendly ideas for the event.",
+        "Implement a sustainability pledge for all event participants.",
+        "Create a green team to oversee the event's environmental initiatives.",
+        "Conduct a carbon footprint analysis and offset emissions."
     ]
+}
 
-    event_specific_tips = {
-        "Conference or Seminar": [
-            "Encourage speakers to use digital presentations instead of handouts.",
-            "Set up a dedicated app for the conference to reduce printed materials.",
-            "Offer virtual attendance options to reduce travel-related emissions.",
-            "Implement a 'green speaker' certification for presenters who follow sustainable practices.",
-            "Organize networking sessions around sustainability themes."
-        ],
-        "Board Meeting": [
-            "Implement a bring-your-own-device policy to reduce the need for printing.",
-            "Use video conferencing for board members who can't attend in person.",
-            "Choose a meeting venue close to where most board members are based.",
-            "Provide reusable water bottles or glasses instead of disposable options.",
-            "Implement paperless voting systems for board decisions."
-        ],
-        "Team Building Event": [
-            "Choose outdoor locations to reduce energy consumption.",
-            "Incorporate sustainability challenges into team building activities.",
-            "Use eco-friendly materials for any team building supplies or equipment.",
-            "Partner with local environmental organizations for volunteer activities.",
-            "Provide sustainable transportation options for team members."
-        ],
-        "Product Launch": [
-            "Use virtual or augmented reality for product demonstrations to reduce physical waste.",
-            "Offer digital goodie bags instead of physical ones.",
-            "Highlight the product's sustainability features in the launch presentation.",
-            "Use energy-efficient lighting and sound systems for the event.",
-            "Implement a product packaging return or recycling program at the launch."
-        ],
-        "Annual General Meeting": [
-            "Provide digital voting options to reduce paper use.",
-            "Stream the meeting live for shareholders who can't attend in person.",
-            "Offer incentives for shareholders who choose digital over printed materials.",
-            "Include a presentation on the company's sustainability initiatives.",
-            "Choose a central, easily accessible location to minimize travel."
-        ],
-        "Trade Show or Exhibition": [
-            "Design modular, reusable booth elements to reduce waste.",
-            "Use QR codes for information sharing instead of printed brochures.",
-            "Implement a 'green exhibitor' certification program.",
-            "Organize a sustainability award for the most eco-friendly booth.",
-            "Provide centralized recycling stations throughout the exhibition area."
-        ],
-        "Corporate Party or Celebration": [
-            "Choose venues that support local communities and sustainable practices.",
-            "Opt for e-tickets or app-based guest lists instead of paper tickets.",
-            "Use locally-sourced, seasonal ingredients for catering.",
-            "Implement a zero-waste policy for the event.",
-            "Donate leftover food to local charities or food banks."
-        ],
-        "Other Corporate Event": [
-            "Consider the unique aspects of your event and how to make them more sustainable.",
-            "Engage employees in brainstorming eco-friendly ideas for the event.",
-            "Implement a sustainability pledge for all event participants.",
-            "Create a green team to oversee the event's environmental initiatives.",
-            "Conduct a carbon footprint analysis and offset emissions."
-        ]
-    }
-
-    return common_tips + event_specific_tips.get(event_type, [])
+def load_eco_tips(event_type):
+    return COMMON_TIPS + EVENT_SPECIFIC_TIPS.get(event_type, [])
+
+# Each page's list as one markdown block rather than an element per line
+ECO_TIPS_MARKDOWN = {
+    event_type: "\n\n".join(f"• {tip}" for tip in load_eco_tips(event_type))
+    for event_type in EVENT_TYPES
+}
+
+RESOURCES = [
+    {"name": "Sustainable event planning - Berlin Convention Office", "url": "https://convention.visitberlin.de/en/sustainable-event-planning"},
+    {"name": "The Importance of Eco-Friendly Events and How to Plan Them - Events Made Simple", "url": "https://www.eventsmadesimple.co.uk/the-importance-of-eco-friendly-events-and-how-to-plan-them/"},
+    {"name": "Sustainability Tracking Software - Momentus Technologies", "url": "https://gomomentus.com/"},
+    {"name": "Sustainable Event Planning: Beyond the Basics - The Event Planner Expo", "url": "https://www.theeventplannerexpo.com/sustainable-event-planning-beyond-the-basics/"},
+    {"name": "10 Green Event Ideas That Can Make a Huge Difference - Cvent Blog", "url": "https://www.cvent.com/en/blog/events/green-event-ideas"},
+]
+
+RESOURCES_MARKDOWN = "\n\n".join(f"• [{resource['name']}]({resource['url']})" for resource in RESOURCES)
+
+def debug_requested():
+    # Opt in per session with ?debug=1 in the URL
+    return st.query_params.get("debug") == "1"
+
+def record_store_gauges(store):
+    metrics.registry.gauge("store_events", len(store))
+    metrics.registry.gauge("store_bytes", store.size_bytes())
+
+def display_debug_panel(run):
+    # This rerun's phase timings next to the process-wide totals
+    snapshot = metrics.registry.snapshot()
+    gauges = snapshot["gauges"]
+    with st.sidebar.expander("Performance metrics", expanded=True):
+        st.write(f"Store: {gauges['store_events']} events, {gauges['store_bytes'] / 1024:.1f} KiB")
+        rows = []
+        for phase, stats in sorted(snapshot["phases"].items()):
+            rows.append({
+                "phase": phase,
+                "this run (ms)": round(run.get(phase, 0.0) * 1000, 2),
+                "calls": stats["count"],
+                "mean (ms)": round(stats["total_seconds"] / stats["count"] * 1000, 2),
+                "max (ms)": round(stats["max_seconds"] * 1000, 2),
+            })
+        st.dataframe(rows, hide_index=True)
+        if snapshot["counters"]:
+            st.write(snapshot["counters"])
+        st.download_button("Prometheus metrics", metrics.registry.prometheus_text(), file_name="eco_metrics.prom", mime="text/plain")
+        st.download_button("JSON lines", metrics.registry.json_line(run), file_name="eco_metrics.jsonl", mime="application/json")
 
 if __name__ == "__main__":
-    main()
+    debug = debug_requested()
+    with metrics.registry.run(debug) as run:
+        with metrics.registry.timer("rerun"):
+            main()
+    if run is not None:
+        record_store_gauges(get_store())
+        if metrics.EXPORT_PATH:
+            metrics.registry.export(metrics.EXPORT_PATH, run)
+        if debug:
+            display_debug_panel(run)
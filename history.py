@@ -0,0 +1,300 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+from catalog import get_checklist, record_identity, record_state
+from scoring import score_record
+
+# Revision history of every event, in a SQLite database next to the store.
+#
+# Each committed save appends one row per changed event to `revisions`:
+# the ids of the items whose implemented/N/A bit flipped, the custom
+# measures only when they changed, and the event's score afterwards. A row
+# costs bytes per edit rather than a copy of the checklist. Every
+# SNAPSHOT_INTERVAL revisions the full state is written to `snapshots` as
+# well, so rebuilding an event at any point replays at most that many rows.
+#
+# `type_totals` keeps, per event type, the running number of events and
+# sum of their scores after every change, so the mean score of a type at
+# any moment is a single index seek and a time range is read directly,
+# never by replaying the log from the start.
+
+# Where history is kept; defaults to "<store>.history.db" beside the store
+DEFAULT_HISTORY_PATH = os.environ.get("ECO_HISTORY_PATH")
+
+SNAPSHOT_INTERVAL = 20
+
+Revision = namedtuple("Revision", "seq timestamp event_type event_date implemented_flips na_flips custom_measures score")
+
+EventState = namedtuple("EventState", "seq event_type event_date implemented na custom_measures")
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS revisions ("
+    " event_id TEXT NOT NULL,"
+    " seq INTEGER NOT NULL,"
+    " ts TEXT NOT NULL,"
+    " event_type TEXT NOT NULL,"
+    " event_date TEXT,"
+    " implemented_flips TEXT NOT NULL,"
+    " na_flips TEXT NOT NULL,"
+    " custom_measures TEXT,"
+    " score REAL NOT NULL,"
+    " PRIMARY KEY (event_id, seq))",
+    "CREATE INDEX IF NOT EXISTS revisions_by_time ON revisions (event_id, ts)",
+    "CREATE TABLE IF NOT EXISTS snapshots ("
+    " event_id TEXT NOT NULL,"
+    " seq INTEGER NOT NULL,"
+    " implemented TEXT NOT NULL,"
+    " na TEXT NOT NULL,"
+    " custom_measures TEXT NOT NULL,"
+    " PRIMARY KEY (event_id, seq))",
+    "CREATE TABLE IF NOT EXISTS type_totals ("
+    " id INTEGER PRIMARY KEY,"
+    " event_type TEXT NOT NULL,"
+    " ts TEXT NOT NULL,"
+    " events INTEGER NOT NULL,"
+    " score_sum REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS type_totals_by_time ON type_totals (event_type, ts)",
+    "CREATE INDEX IF NOT EXISTS type_totals_latest ON type_totals (event_type, id)",
+    "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)",
+)
+
+
+def history_path(store_path):
+    return DEFAULT_HISTORY_PATH or os.path.splitext(store_path)[0] + ".history.db"
+
+
+def _flips(old_mask, new_mask):
+    # Ids of the bits that differ, as "3,17"
+    bits = bin(old_mask ^ new_mask)[:1:-1]
+    return ",".join([str(item_id) for item_id, bit in enumerate(bits) if bit == "1"])
+
+
+def _apply_flips(mask, flips):
+    for item_id in flips.split(",") if flips else ():
+        mask ^= 1 << int(item_id)
+    return mask
+
+
+def _state(event_id, record):
+    # (event_type, event_date, implemented, na, custom_measures) of a record
+    if record is None:
+        return None, None, 0, 0, []
+    event_type, event_date = record_identity(event_id, record)
+    checklist = get_checklist(event_type)
+    implemented, na = record_state(record, checklist)
+    custom_measures = [list(m) for m in record.get("custom_measures", [])]
+    return checklist.event_type, event_date, implemented, na, custom_measures
+
+
+class HistoryLog:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        for statement in SCHEMA:
+            self._conn.execute(statement)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _on_commit(self, store, changes):
+        timestamp = datetime.now().isoformat(sep=" ")
+        self.record_changes((event_id, old_record, new_record, timestamp) for event_id, old_record, new_record in changes)
+
+    def _backfill(self, store):
+        # A store that predates the history gets one starting revision per
+        # event, dated by its last save
+        if self._meta("seeded") or not len(store):
+            self._set_meta("seeded", "1")
+            return
+        changes = [
+            (event_id, None, record, record.get("date") or datetime.now().isoformat(sep=" "))
+            for event_id, record, _ in store.iter_records()
+        ]
+        changes.sort(key=lambda change: change[3])
+        self.record_changes(changes)
+        self._set_meta("seeded", "1")
+
+    def _meta(self, name):
+        row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, name, value):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+    def record_changes(self, changes):
+        # changes: (event_id, old_record, new_record, timestamp); written in
+        # one transaction. Saves that change nothing tracked are skipped.
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                revisions, snapshots, totals = [], [], {}
+                for event_id, old_record, new_record, timestamp in changes:
+                    self._append(event_id, old_record, new_record, timestamp, revisions, snapshots, totals)
+                self._conn.executemany("INSERT INTO revisions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", revisions)
+                self._conn.executemany("INSERT INTO snapshots VALUES (?, ?, ?, ?, ?)", snapshots)
+                for event_type in totals:
+                    self._write_total(event_type, totals)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _append(self, event_id, old_record, new_record, timestamp, revisions, snapshots, totals):
+        old_type, old_date, old_implemented, old_na, old_custom = _state(event_id, old_record)
+        event_type, event_date, implemented, na, custom_measures = _state(event_id, new_record)
+        custom_changed = custom_measures != old_custom
+        if (event_type, event_date, implemented, na) == (old_type, old_date, old_implemented, old_na) and not custom_changed:
+            return
+        seq = 1
+        if old_record is not None:
+            row = self._conn.execute("SELECT MAX(seq) FROM revisions WHERE event_id = ?", (event_id,)).fetchone()
+            seq = (row[0] or 0) + 1
+        score = score_record(event_id, new_record)[1].score
+        revisions.append((
+            event_id, seq, timestamp, event_type, event_date,
+            _flips(old_implemented, implemented), _flips(old_na, na),
+            json.dumps(custom_measures) if custom_changed and seq > 1 else None,
+            score,
+        ))
+        if seq == 1 or seq % SNAPSHOT_INTERVAL == 0:
+            snapshots.append((event_id, seq, hex(implemented), hex(na), json.dumps(custom_measures)))
+        # The event leaves its old type's totals and joins the new one's
+        if old_record is not None:
+            self._add_total(old_type, timestamp, -1, -score_record(event_id, old_record)[1].score, totals)
+        self._add_total(event_type, timestamp, 1, score, totals)
+
+    def _add_total(self, event_type, timestamp, events, score_sum, totals):
+        # totals: event_type -> [events, score_sum, timestamp, unwritten];
+        # one row is written per type and timestamp
+        if event_type not in totals:
+            row = self._conn.execute(
+                "SELECT events, score_sum FROM type_totals WHERE event_type = ? ORDER BY id DESC LIMIT 1",
+                (event_type,),
+            ).fetchone()
+            totals[event_type] = [*(row or (0, 0.0)), timestamp, False]
+        elif totals[event_type][2] != timestamp:
+            self._write_total(event_type, totals)
+        total = totals[event_type]
+        total[0] += events
+        total[1] += score_sum
+        total[2] = timestamp
+        total[3] = True
+
+    def _write_total(self, event_type, totals):
+        events, score_sum, timestamp, unwritten = totals[event_type]
+        if unwritten:
+            self._conn.execute(
+                "INSERT INTO type_totals (event_type, ts, events, score_sum) VALUES (?, ?, ?, ?)",
+                (event_type, timestamp, events, score_sum),
+            )
+            totals[event_type][3] = False
+
+    def revisions(self, event_id, start=None, end=None):
+        # Revisions of one event, oldest first; start/end are inclusive
+        # timestamps (or dates) and read straight from the index
+        query = "SELECT seq, ts, event_type, event_date, implemented_flips, na_flips, custom_measures, score FROM revisions WHERE event_id = ?"
+        parameters = [event_id]
+        if start is not None:
+            query += " AND ts >= ?"
+            parameters.append(str(start))
+        if end is not None:
+            query += " AND ts <= ?"
+            parameters.append(_end_of(end))
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY seq", parameters).fetchall()
+        return [Revision(*row) for row in rows]
+
+    def state_at(self, event_id, timestamp=None):
+        # The event as it was after its last revision at or before
+        # `timestamp` (default: now), from the nearest snapshot onwards
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(seq) FROM revisions WHERE event_id = ? AND ts <= ?",
+                (event_id, _end_of(timestamp) if timestamp is not None else "9999"),
+            ).fetchone()
+            target = row[0]
+            if target is None:
+                return None
+            seq, implemented, na, custom = self._conn.execute(
+                "SELECT seq, implemented, na, custom_measures FROM snapshots"
+                " WHERE event_id = ? AND seq <= ? ORDER BY seq DESC LIMIT 1",
+                (event_id, target),
+            ).fetchone()
+            rows = self._conn.execute(
+                "SELECT seq, event_type, event_date, implemented_flips, na_flips, custom_measures FROM revisions"
+                " WHERE event_id = ? AND seq BETWEEN ? AND ? ORDER BY seq",
+                (event_id, seq, target),
+            ).fetchall()
+        implemented, na, custom_measures = int(implemented, 16), int(na, 16), json.loads(custom)
+        event_type = event_date = None
+        for revision_seq, event_type, event_date, implemented_flips, na_flips, changed_custom in rows:
+            # The snapshot already includes its own revision's changes
+            if revision_seq > seq:
+                implemented = _apply_flips(implemented, implemented_flips)
+                na = _apply_flips(na, na_flips)
+                if changed_custom is not None:
+                    custom_measures = json.loads(changed_custom)
+        return EventState(target, event_type, event_date, implemented, na, custom_measures)
+
+    def event_scores(self, event_id, start=None, end=None):
+        # Score after every revision: a DataFrame indexed by timestamp.
+        # pandas is only loaded once a chart is drawn
+        import pandas as pd
+
+        revisions = self.revisions(event_id, start, end)
+        return pd.DataFrame(
+            {"score": [revision.score for revision in revisions]},
+            index=pd.to_datetime(pd.Series([revision.timestamp for revision in revisions], dtype=object), format="ISO8601", errors="coerce"),
+        )
+
+    def type_scores(self, event_type, start=None, end=None):
+        # Mean score and number of events of a type after every change in
+        # [start, end], starting from the totals in force at `start`
+        import pandas as pd
+
+        with self._lock:
+            rows = []
+            if start is not None:
+                rows = self._conn.execute(
+                    "SELECT ts, events, score_sum FROM type_totals WHERE event_type = ? AND ts < ?"
+                    " ORDER BY ts DESC, id DESC LIMIT 1",
+                    (event_type, str(start)),
+                ).fetchall()
+                rows = [(str(start), events, score_sum) for _, events, score_sum in rows]
+            query = "SELECT ts, events, score_sum FROM type_totals WHERE event_type = ?"
+            parameters = [event_type]
+            if start is not None:
+                query += " AND ts >= ?"
+                parameters.append(str(start))
+            if end is not None:
+                query += " AND ts <= ?"
+                parameters.append(_end_of(end))
+            rows += self._conn.execute(query + " ORDER BY ts, id", parameters).fetchall()
+        frame = pd.DataFrame(rows, columns=["timestamp", "events", "score_sum"])
+        frame["mean_score"] = (frame["score_sum"] / frame["events"]).where(frame["events"] > 0)
+        frame.index = pd.to_datetime(frame.pop("timestamp"), format="ISO8601", errors="coerce")
+        return frame[["mean_score", "events"]]
+
+
+def _end_of(value):
+    # An end date covers the whole day
+    value = str(value)
+    return value + " 99" if len(value) == 10 else value
+
+
+def attach(store, path=None):
+    # Record every commit to `store` from now on; existing events are
+    # seeded once
+    log = HistoryLog(path or history_path(store.path))
+    store.add_observer(log._on_commit, backfill=log._backfill)
+    return log
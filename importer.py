@@ -0,0 +1,355 @@
+"""Import events from a CSV or Excel spreadsheet into a progress store.
+
+    python importer.py events.csv progress.db
+    python importer.py events.xlsx progress.db --map "Bikes=custom:Bike racks" --skip-invalid
+    python importer.py events.csv progress.db --dry-run
+
+One row per event. Columns are mapped by header: event_id, name, owner,
+event_type and event_date (or close variants), one column per checklist
+item named after the item's text (or "item:<id>"), and "custom:<measure>"
+for custom measures. Cells say yes/no/n/a; blank leaves an item unticked
+and leaves a custom measure out. --map overrides the mapping for a header;
+"ignore" drops a column.
+
+The file is read in chunks and every chunk is validated with whole-column
+operations. Nothing is written unless every row is valid (or
+--skip-invalid is given). Then all events are written in one put_many(),
+which is one transaction. Rows with the event_id of a stored event replace
+it; rows without an event_id become new events.
+"""
+import argparse
+import re
+import sys
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+import history
+from catalog import CHECKLISTS, EVENT_TYPES, ITEMS_BY_ID, MAX_ITEM_ID, make_record
+from registry import new_event_id
+from storage import open_store
+
+DEFAULT_CHUNK_SIZE = 10000
+
+IDENTITY_FIELDS = ("event_id", "name", "owner", "event_type", "event_date")
+
+REQUIRED_FIELDS = ("event_type", "event_date")
+
+HEADER_ALIASES = {
+    "event_id": "event_id", "id": "event_id",
+    "name": "name", "event_name": "name", "event": "name",
+    "owner": "owner", "organiser": "owner", "organizer": "owner",
+    "event_type": "event_type", "type": "event_type",
+    "event_date": "event_date", "date": "event_date",
+}
+
+# Cell value -> (implemented, not applicable); "no" marks a custom measure
+# as listed but not done
+CELL_STATES = {
+    "": None,
+    "yes": (True, False), "y": (True, False), "true": (True, False), "1": (True, False),
+    "x": (True, False), "done": (True, False), "implemented": (True, False),
+    "no": (False, False), "n": (False, False), "false": (False, False), "0": (False, False),
+    "n/a": (False, True), "na": (False, True), "not applicable": (False, True),
+}
+
+_IMPLEMENTED_VALUES = [value for value, state in CELL_STATES.items() if state and state[0]]
+_NA_VALUES = [value for value, state in CELL_STATES.items() if state and state[1]]
+_CANONICAL_TYPES = {event_type.lower(): event_type for event_type in EVENT_TYPES}
+
+# How many errors are kept; the total is still counted
+MAX_ERRORS = 1000
+
+ImportResult = namedtuple("ImportResult", "records rows errors error_count ignored_cells")
+
+_TYPE_CODES = {event_type: code for code, event_type in enumerate(EVENT_TYPES)}
+_WORDS = MAX_ITEM_ID // 64 + 1
+
+
+def _normalize(text):
+    return re.sub(r"[\s_]+", " ", str(text).strip().lower()).rstrip(".:")
+
+
+_ITEM_IDS_BY_TEXT = {}
+for _item in ITEMS_BY_ID.values():
+    _ITEM_IDS_BY_TEXT.setdefault(_normalize(_item.text), []).append(_item.id)
+
+
+def auto_mapping(columns):
+    # {column: target}: an identity field, "item:<id>[,<id>...]" (one item
+    # text can appear under several event types), "custom:<measure>", or
+    # None for columns that aren't recognised
+    mapping = {}
+    for column in columns:
+        key = _normalize(column)
+        raw = str(column).strip()
+        if key.replace(" ", "_") in HEADER_ALIASES:
+            mapping[column] = HEADER_ALIASES[key.replace(" ", "_")]
+        elif key in _ITEM_IDS_BY_TEXT:
+            mapping[column] = "item:" + ",".join(map(str, _ITEM_IDS_BY_TEXT[key]))
+        elif key.startswith("item:"):
+            mapping[column] = "item:" + ",".join(item_id.strip() for item_id in key[5:].split(","))
+        elif raw.lower().startswith("custom:") and raw[7:].strip():
+            # The measure keeps its own casing
+            mapping[column] = "custom:" + raw[7:].strip()
+        else:
+            mapping[column] = None
+    return mapping
+
+
+def check_mapping(mapping):
+    # Problems that make the whole file unusable, as messages
+    problems = []
+    targets = [target for target in mapping.values() if target]
+    for field in REQUIRED_FIELDS:
+        if field not in targets:
+            problems.append(f"No column is mapped to {field}")
+    seen = set()
+    for target in targets:
+        if target in seen:
+            problems.append(f"More than one column is mapped to {target}")
+        seen.add(target)
+        if target.startswith("item:"):
+            for item_id in target[5:].split(","):
+                if not item_id.isdigit() or int(item_id) not in ITEMS_BY_ID:
+                    problems.append(f"Unknown checklist item {target}")
+        elif not target.startswith("custom:") and target not in IDENTITY_FIELDS:
+            problems.append(f"Unknown target {target}")
+    return problems
+
+
+def read_chunks(source, chunk_size=DEFAULT_CHUNK_SIZE, filename=None):
+    # Yields DataFrames of strings; source is a path or a file-like object
+    # (filename then gives the format)
+    filename = filename or source
+    if str(filename).lower().endswith((".xlsx", ".xlsm")):
+        yield from _read_excel_chunks(source, chunk_size)
+        return
+    yield from pd.read_csv(source, dtype=str, keep_default_na=False, chunksize=chunk_size, skipinitialspace=True)
+
+
+def _read_excel_chunks(source, chunk_size):
+    # pandas can't read Excel in chunks; openpyxl's read-only mode streams
+    # rows instead of loading the sheet
+    try:
+        import openpyxl
+    except ImportError:
+        raise RuntimeError("Excel import needs openpyxl: pip install openpyxl")
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell) if cell is not None else f"column {index + 1}" for index, cell in enumerate(next(rows, ()))]
+        chunk = []
+        for row in rows:
+            chunk.append([_cell_text(cell) for cell in row[:len(header)]])
+            if len(chunk) >= chunk_size:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+def _cell_text(cell):
+    if cell is None:
+        return ""
+    if isinstance(cell, datetime):
+        return cell.date().isoformat()
+    if isinstance(cell, bool):
+        return "yes" if cell else "no"
+    if isinstance(cell, float) and cell.is_integer():
+        return str(int(cell))
+    return str(cell)
+
+
+def _states(values):
+    # (implemented, na, valid, present) boolean arrays for a column of
+    # cell strings
+    normalized = values.str.strip().str.lower()
+    implemented = normalized.isin(_IMPLEMENTED_VALUES).to_numpy()
+    na = normalized.isin(_NA_VALUES).to_numpy()
+    valid = normalized.isin(list(CELL_STATES)).to_numpy()
+    present = (normalized != "").to_numpy()
+    return implemented, na, valid, present
+
+
+def _masks(bit_columns):
+    # bit_columns: [(item_id, bool array)] -> Python int mask per row, built
+    # 64 bits at a time
+    if not bit_columns:
+        return None
+    rows = len(bit_columns[0][1])
+    words = np.zeros((rows, _WORDS), dtype=np.uint64)
+    for item_id, bits in bit_columns:
+        words[:, item_id // 64] |= bits.astype(np.uint64) << np.uint64(item_id % 64)
+    return [sum(int(word) << (64 * index) for index, word in enumerate(row)) for row in words.tolist()]
+
+
+def validate_chunk(frame, mapping, first_row, now, seen_ids):
+    # (records, errors, invalid_rows, ignored_cells) for one chunk. Row
+    # numbers in errors are spreadsheet rows (the header is row 1).
+    # seen_ids collects ids across chunks so duplicates are caught
+    # file-wide.
+    rows = len(frame)
+    row_numbers = np.arange(first_row + 2, first_row + 2 + rows)
+    columns = {target: column for column, target in mapping.items() if target}
+    errors = []
+    invalid = np.zeros(rows, dtype=bool)
+
+    def fail(mask, column, message):
+        nonlocal invalid
+        invalid |= mask
+        for row in row_numbers[mask][:MAX_ERRORS]:
+            errors.append((int(row), column, message))
+
+    def text(field):
+        if field not in columns:
+            return pd.Series([""] * rows, index=frame.index)
+        return frame[columns[field]].astype(str).str.strip()
+
+    event_types = text("event_type").str.lower().map(_CANONICAL_TYPES)
+    fail(event_types.isna().to_numpy(), columns["event_type"], "Unknown event type")
+
+    raw_dates = text("event_date")
+    dates = pd.to_datetime(raw_dates, errors="coerce", format="mixed")
+    fail(dates.isna().to_numpy(), columns["event_date"], "Not a date")
+    event_dates = dates.dt.strftime("%Y-%m-%d").fillna("")
+
+    event_ids = text("event_id")
+    given = (event_ids != "").to_numpy()
+    duplicate = event_ids.duplicated(keep="first").to_numpy() | event_ids.isin(list(seen_ids)).to_numpy()
+    fail(given & duplicate, columns.get("event_id"), "Duplicate event_id")
+    seen_ids.update(event_ids[given])
+
+    type_codes = event_types.map(_TYPE_CODES).fillna(0).astype(int).to_numpy()
+    implemented_bits, na_bits = [], []
+    ignored = np.zeros(rows, dtype=int)
+    custom_columns = []
+    for target, column in columns.items():
+        if not target.startswith(("item:", "custom:")):
+            continue
+        implemented, na, valid, present = _states(frame[column].astype(str))
+        fail(~valid, column, "Expected yes, no, n/a or blank")
+        if target.startswith("custom:"):
+            custom_columns.append((target[7:], implemented, na, present))
+            continue
+        item_ids = [int(item_id) for item_id in target[5:].split(",")]
+        # Cells for items that aren't on the row's event type are dropped
+        on_checklist = np.array([
+            any(CHECKLISTS[event_type].mask >> item_id & 1 for item_id in item_ids)
+            for event_type in EVENT_TYPES
+        ])
+        ignored += (present & ~on_checklist[type_codes]).astype(int)
+        for item_id in item_ids:
+            implemented_bits.append((item_id, implemented))
+            na_bits.append((item_id, na))
+
+    implemented_masks = _masks(implemented_bits) or [0] * rows
+    na_masks = _masks(na_bits) or [0] * rows
+    names, owners = text("name").tolist(), text("owner").tolist()
+    event_types, event_dates, event_ids = event_types.tolist(), event_dates.tolist(), event_ids.tolist()
+    custom_columns = [
+        (measure, implemented.tolist(), na.tolist(), present.tolist())
+        for measure, implemented, na, present in custom_columns
+    ]
+    records = []
+    for row in np.flatnonzero(~invalid).tolist():
+        type_mask = CHECKLISTS[event_types[row]].mask
+        custom_measures = [
+            [measure, implemented[row], na[row]]
+            for measure, implemented, na, present in custom_columns
+            if present[row]
+        ]
+        records.append((event_ids[row] or new_event_id(), make_record(
+            event_types[row], event_dates[row],
+            implemented_masks[row] & type_mask, na_masks[row] & type_mask,
+            custom_measures, now, names[row], owners[row],
+        )))
+    return records, errors, int(invalid.sum()), int(ignored[~invalid].sum())
+
+
+def prepare(chunks, mapping, now=None):
+    # Validate every chunk; nothing is written here
+    now = now or str(datetime.now())
+    records, errors = [], []
+    rows = error_count = ignored_cells = 0
+    seen_ids = set()
+    for frame in chunks:
+        chunk_records, chunk_errors, invalid_rows, ignored = validate_chunk(frame, mapping, rows, now, seen_ids)
+        records.extend(chunk_records)
+        errors.extend(chunk_errors[:MAX_ERRORS - len(errors)])
+        error_count += invalid_rows
+        ignored_cells += ignored
+        rows += len(frame)
+    return ImportResult(records, rows, errors, error_count, ignored_cells)
+
+
+def write(store, records):
+    # One put_many: a single transaction, one listener/observer pass.
+    # Stored events with the same id are replaced; raises ConflictError if
+    # one changes while this runs.
+    records = dict(records)
+    return store.put_many(records, {event_id: store.version(event_id) for event_id in records})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help=".csv or .xlsx")
+    parser.add_argument("store", help="progress store (.json or .db)")
+    parser.add_argument("--map", action="append", default=[], metavar="HEADER=TARGET",
+                        help="map a column: event_id, name, owner, event_type, event_date, item:<id>, custom:<measure> or ignore")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--skip-invalid", action="store_true", help="import the valid rows even if some rows are invalid")
+    parser.add_argument("--dry-run", action="store_true", help="validate only")
+    args = parser.parse_args(argv)
+
+    chunks = read_chunks(args.source, args.chunk_size)
+    first = next(chunks, None)
+    if first is None:
+        sys.exit(f"{args.source} has no header row")
+    mapping = auto_mapping(first.columns)
+    for override in args.map:
+        header, _, target = override.partition("=")
+        if header not in mapping:
+            sys.exit(f"No column named {header!r}")
+        mapping[header] = None if target == "ignore" else target
+    problems = check_mapping(mapping)
+    if problems:
+        sys.exit("\n".join(problems))
+    unmapped = [column for column, target in mapping.items() if target is None]
+    if unmapped:
+        print(f"Ignoring columns: {', '.join(map(str, unmapped))}", file=sys.stderr)
+
+    def all_chunks():
+        yield first
+        yield from chunks
+
+    result = prepare(all_chunks(), mapping)
+    for row, column, message in result.errors[:20]:
+        print(f"row {row}, {column}: {message}", file=sys.stderr)
+    if result.error_count:
+        print(f"{result.error_count} of {result.rows} rows are invalid", file=sys.stderr)
+    if result.ignored_cells:
+        print(f"{result.ignored_cells} cells were for items not on their event type's checklist and were ignored", file=sys.stderr)
+    if result.error_count and not args.skip_invalid:
+        sys.exit(1)
+    if args.dry_run:
+        print(f"{len(result.records)} events would be imported")
+        return
+
+    store = aggregates.attach(open_store(args.store, cache_size=0))
+    log = history.attach(store)
+    try:
+        write(store, result.records)
+    finally:
+        log.close()
+        store.close()
+    print(f"Imported {len(result.records)} events into {args.store}")
+
+
+if __name__ == "__main__":
+    main()
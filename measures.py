@@ -0,0 +1,240 @@
+import heapq
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from collections import namedtuple
+from difflib import SequenceMatcher
+
+# Every custom measure across all stored events, deduplicated by a
+# normalized form of its text and counted by how many events use it:
+#
+#   measures     normalized text -> [events, {spelling: events}]
+#   by word      word -> normalized texts containing it, with a sorted
+#                word list for prefix matches
+#   by trigram   3-character gram of " word " -> words, to find the
+#                closest spellings of a mistyped word
+#   by count     events -> normalized texts used by that many events
+#
+# Like the event registry, the index is built with one scan and kept
+# current by a store observer; if another process writes the store, the
+# next query rebuilds it.
+
+Suggestion = namedtuple("Suggestion", "text events key")
+
+# A typed word that matches nothing stands in for up to CLOSE_WORDS words
+# at least this alike (difflib ratio). Candidates are the CLOSE_CANDIDATES
+# words sharing most trigrams with it; short words share few, so the
+# trigrams only shortlist and the ratio decides.
+CLOSE_WORD_MIN = 0.75
+CLOSE_WORDS = 5
+CLOSE_CANDIDATES = 50
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize(text):
+    # Case, accents, punctuation, spacing and simple plurals don't make a
+    # different measure: "Bike-racks " and "bike rack" are the same one
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode("ascii")
+    words = _NON_WORD.sub(" ", text.casefold()).split()
+    return " ".join(word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word for word in words)
+
+
+def _grams(word):
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _keys(record):
+    # One count per event however often it lists a measure
+    if record is None:
+        return {}
+    keys = {}
+    for measure in record.get("custom_measures", []):
+        text = str(measure[0]).strip()
+        key = normalize(text)
+        if key and key not in keys:
+            keys[key] = text
+    return keys
+
+
+class MeasureIndex:
+    def __init__(self, store):
+        self.store = store
+        # Commits update the index while holding the store's lock, so
+        # queries take the same one
+        self._lock = store.lock
+        self._clear()
+        store.add_observer(self._on_commit, backfill=self._rebuild)
+
+    def _clear(self):
+        self._measures = {}
+        self._by_word = {}
+        self._words = []
+        self._by_gram = {}
+        self._by_count = {}
+        self._generation = None
+
+    def _rebuild(self, store):
+        with self._lock:
+            self._clear()
+            self._generation = store.generation()
+            for _, record, _ in store.iter_records():
+                for key, text in _keys(record).items():
+                    self._add(key, text, bulk=True)
+            # Sorted once at the end rather than kept sorted per insert
+            self._words = sorted(self._by_word)
+
+    def _on_commit(self, store, changes):
+        with self._lock:
+            if self._generation != store.generation():
+                self._rebuild(store)
+                return
+            for _, old_record, new_record in changes:
+                old_keys, new_keys = _keys(old_record), _keys(new_record)
+                for key, text in old_keys.items():
+                    if new_keys.get(key) != text:
+                        self._remove(key, text)
+                for key, text in new_keys.items():
+                    if old_keys.get(key) != text:
+                        self._add(key, text)
+
+    def _add(self, key, text, bulk=False):
+        entry = self._measures.get(key)
+        if entry is None:
+            entry = self._measures[key] = [0, {}]
+            for word in set(key.split()):
+                if word not in self._by_word:
+                    self._by_word[word] = set()
+                    for gram in _grams(word):
+                        self._by_gram.setdefault(gram, set()).add(word)
+                    if not bulk:
+                        insort(self._words, word)
+                self._by_word[word].add(key)
+            self._by_count.setdefault(1, set()).add(key)
+        else:
+            self._recount(key, entry[0], entry[0] + 1)
+        entry[0] += 1
+        entry[1][text] = entry[1].get(text, 0) + 1
+
+    def _remove(self, key, text):
+        entry = self._measures[key]
+        entry[1][text] -= 1
+        if not entry[1][text]:
+            del entry[1][text]
+        entry[0] -= 1
+        if entry[0]:
+            self._recount(key, entry[0] + 1, entry[0])
+            return
+        self._recount(key, 1, None)
+        del self._measures[key]
+        for word in set(key.split()):
+            keys = self._by_word[word]
+            keys.discard(key)
+            if keys:
+                continue
+            del self._by_word[word]
+            del self._words[bisect_left(self._words, word)]
+            for gram in _grams(word):
+                words = self._by_gram[gram]
+                words.discard(word)
+                if not words:
+                    del self._by_gram[gram]
+
+    def _recount(self, key, old, new):
+        keys = self._by_count[old]
+        keys.discard(key)
+        if not keys:
+            del self._by_count[old]
+        if new is not None:
+            self._by_count.setdefault(new, set()).add(key)
+
+    def _sync(self):
+        if self._generation != self.store.generation():
+            self._rebuild(self.store)
+
+    def _suggestion(self, key):
+        events, spellings = self._measures[key]
+        # Shown in its most common spelling
+        return Suggestion(max(spellings, key=spellings.get), events, key)
+
+    def __len__(self):
+        with self._lock:
+            self._sync()
+            return len(self._measures)
+
+    def get(self, text):
+        # The stored measure `text` is a spelling of, or None
+        with self._lock:
+            self._sync()
+            key = normalize(text)
+            return self._suggestion(key) if key in self._measures else None
+
+    def _prefixed(self, prefix):
+        groups = []
+        position = bisect_left(self._words, prefix)
+        while position < len(self._words) and self._words[position].startswith(prefix):
+            groups.append(self._by_word[self._words[position]])
+            position += 1
+        return groups
+
+    def _close(self, word):
+        # Words spelled most like `word`, for when it matches nothing
+        shared = {}
+        for gram in _grams(word):
+            for candidate in self._by_gram.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        candidates = heapq.nlargest(
+            CLOSE_CANDIDATES, shared, key=lambda candidate: (shared[candidate], -abs(len(candidate) - len(word))),
+        )
+        scored = sorted(((SequenceMatcher(None, word, candidate).ratio(), candidate) for candidate in candidates), reverse=True)
+        return [self._by_word[candidate] for score, candidate in scored[:CLOSE_WORDS] if score >= CLOSE_WORD_MIN]
+
+    def _match(self, filters, limit, skip):
+        # The `limit` most used measures in every filter (a list of sets,
+        # matched if any of them holds the measure). Either walk measures
+        # from the most used down until enough pass, or intersect the
+        # filters and rank what survives; pick whichever should touch fewer
+        sizes = [sum(map(len, groups)) for groups in filters]
+        if filters and min(sizes) == 0:
+            return []
+        total = max(len(self._measures), 1)
+        selectivity = 1.0
+        for size in sizes:
+            selectivity *= size / total
+        if not filters or (limit + len(skip)) / max(selectivity, 1 / total) <= min(sizes):
+            matches = []
+            for count in sorted(self._by_count, reverse=True):
+                for key in self._by_count[count]:
+                    if key not in skip and all(any(key in ids for ids in groups) for groups in filters):
+                        matches.append(key)
+                        if len(matches) >= limit:
+                            return matches
+            return matches
+
+        order = sorted(range(len(filters)), key=sizes.__getitem__)
+        candidates = set().union(*filters[order[0]])
+        for index in order[1:]:
+            groups = filters[index]
+            candidates.intersection_update(groups[0] if len(groups) == 1 else set().union(*groups))
+        candidates.difference_update(skip)
+        return sorted(candidates, key=lambda key: (-self._measures[key][0], key))[:limit]
+
+    def suggest(self, text="", limit=10, exclude=()):
+        # Measures for a partly typed `text`, most used first. Every word of
+        # the text must be a word of the measure, the last one (still being
+        # typed) a prefix of one; if that finds fewer than `limit`, words
+        # that match nothing are swapped for their closest spellings.
+        # `exclude` holds normalized texts to leave out.
+        with self._lock:
+            self._sync()
+            words = normalize(text).split()
+            exact = [[self._by_word[word]] if word in self._by_word else [] for word in words[:-1]]
+            if words:
+                exact.append(self._prefixed(words[-1]))
+            skip = set(exclude)
+            found = self._match(exact, limit, skip)
+            if len(found) < limit and any(not groups for groups in exact):
+                close = [groups or self._close(word) for word, groups in zip(words, exact)]
+                found += self._match(close, limit - len(found), skip | set(found))
+            return [self._suggestion(key) for key in found]
@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+# Collect timings and counters for every session in this process
+ENABLED = os.environ.get("ECO_METRICS", "").lower() in ("1", "true", "yes")
+
+# Written after every rerun when set: a .jsonl path gets one line appended
+# per rerun, anything else is overwritten with Prometheus text format
+EXPORT_PATH = os.environ.get("ECO_METRICS_EXPORT")
+
+
+class Metrics:
+    # Phase timings (count, total and max seconds), counters and gauges for
+    # the hot paths. When collection is off, timed() wrappers cost one
+    # attribute check per call. A single thread (a Streamlit session's
+    # script run) can also opt in on its own with run(), which additionally
+    # records that rerun's phases for the debug panel.
+
+    def __init__(self, enabled=ENABLED):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._phases = {}
+        self._counters = {}
+        self._gauges = {}
+        self._local = threading.local()
+
+    def active(self):
+        return self.enabled or getattr(self._local, "run", None) is not None
+
+    def record(self, phase, seconds):
+        with self._lock:
+            stats = self._phases.setdefault(phase, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+        run = getattr(self._local, "run", None)
+        if run is not None:
+            run[phase] = run.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, phase):
+        if not self.active():
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - start)
+
+    def timed(self, phase):
+        def decorate(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled and getattr(self._local, "run", None) is None:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(phase, time.perf_counter() - start)
+            return wrapper
+        return decorate
+
+    def incr(self, name, amount=1):
+        if not self.active():
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    @contextmanager
+    def run(self, enabled=True):
+        # Yields a {phase: seconds} dict filled in by this thread until the
+        # block exits, or None when collection is off for this run. Inside
+        # another run it just yields that one.
+        previous = getattr(self._local, "run", None)
+        if previous is not None:
+            yield previous
+            return
+        if not (enabled or self.enabled):
+            yield None
+            return
+        self._local.run = {}
+        try:
+            yield self._local.run
+        finally:
+            self._local.run = previous
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "phases": {
+                    phase: {"count": count, "total_seconds": total, "max_seconds": longest}
+                    for phase, (count, total, longest) in self._phases.items()
+                },
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+            }
+
+    def prometheus_text(self):
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP eco_phase_seconds Time spent in each hot-path phase.",
+            "# TYPE eco_phase_seconds summary",
+        ]
+        for phase, stats in sorted(snapshot["phases"].items()):
+            lines.append(f'eco_phase_seconds_count{{phase="{phase}"}} {stats["count"]}')
+            lines.append(f'eco_phase_seconds_sum{{phase="{phase}"}} {stats["total_seconds"]:.6f}')
+        lines.append("# TYPE eco_phase_seconds_max gauge")
+        for phase, stats in sorted(snapshot["phases"].items()):
+            lines.append(f'eco_phase_seconds_max{{phase="{phase}"}} {stats["max_seconds"]:.6f}')
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE eco_{name}_total counter")
+            lines.append(f"eco_{name}_total {value}")
+        for name, value in sorted(snapshot["gauges"].items()):
+            lines.append(f"# TYPE eco_{name} gauge")
+            lines.append(f"eco_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def json_line(self, run=None):
+        entry = {"timestamp": time.time()}
+        if run is not None:
+            entry["run_ms"] = {phase: round(seconds * 1000, 3) for phase, seconds in run.items()}
+        entry.update(self.snapshot())
+        return json.dumps(entry) + "\n"
+
+    def export(self, path, run=None):
+        if path.endswith(".jsonl"):
+            with open(path, "a") as f:
+                f.write(self.json_line(run))
+            return
+        # Scrapers must never see a half-written file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+
+registry = Metrics()
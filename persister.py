@@ -0,0 +1,201 @@
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import metrics
+from catalog import rebase_record
+from storage import DEFAULT_CACHE_SIZE, ConflictError, LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Seconds edits wait in the queue so rapid successive changes to one event
+# are written once
+DEFAULT_FLUSH_INTERVAL = float(os.environ.get("ECO_FLUSH_INTERVAL", "0.5"))
+
+# How often a write is rebased onto someone else's newer save before giving up
+MAX_REBASES = 5
+
+# A batch that fails to write (read-only directory, full disk, locked
+# database) is retried after RETRY_DELAY seconds, doubling up to
+# MAX_RETRY_DELAY, and written to a file in the temp directory instead
+# after MAX_WRITE_ATTEMPTS failures
+RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 30.0
+MAX_WRITE_ATTEMPTS = 5
+
+# Seconds interpreter exit waits for the queue to be written
+CLOSE_TIMEOUT = 10.0
+
+
+class WriteBehind:
+    # Background writer in front of a ProgressStore. submit() only queues
+    # the record, keyed by event_id, so the caller never waits on disk;
+    # later submits for the same event are merged into the queued record,
+    # which keeps the version it was originally based on. A worker thread
+    # commits the queue every `interval` seconds, in one put_many() when it
+    # can. If another writer got there first, the edit is rebased onto their
+    # version (see catalog.rebase_record) rather than dropped.
+    #
+    # Callers never learn the version their save was committed as, so a
+    # session's next edit still names the version it opened. The worker
+    # remembers what it last committed for each event and, when an edit's
+    # base is exactly that record, bases the edit on that version instead of
+    # treating the session's own earlier save as someone else's.
+    #
+    # Everything still queued is written at interpreter exit, waiting at
+    # most CLOSE_TIMEOUT; flush() writes it now and waits, for tests and
+    # shutdown hooks.
+    #
+    # A batch is timed whenever one of its edits was submitted by a thread
+    # collecting metrics, so ?debug=1 sessions see their own saves.
+
+    def __init__(self, store, interval=DEFAULT_FLUSH_INTERVAL):
+        self.store = store
+        self.interval = interval
+        self._cond = threading.Condition()
+        self._pending = {}
+        self._writing = {}
+        self._flush_requested = False
+        self._collect = False
+        self._closed = False
+        self._failures = 0
+        # event_id -> (version, record) last committed here; worker only
+        self._committed = LRUCache(DEFAULT_CACHE_SIZE)
+        self._thread = threading.Thread(target=self._run, name="progress-write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close, CLOSE_TIMEOUT)
+
+    def submit(self, event_id, record, base_version, base_record):
+        # base_version/base_record: what the caller's edit started from
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("write-behind persister is closed")
+            queued = self._pending.get(event_id)
+            if queued is not None:
+                # Fold this edit into the queued one; for a session's own
+                # successive edits the queued record is its base, so this
+                # just takes the newer record
+                record = rebase_record(base_record, record, queued[0])
+                base_version, base_record = queued[1], queued[2]
+            self._pending[event_id] = (record, base_version, base_record)
+            self._collect = self._collect or metrics.registry.active()
+            self._cond.notify_all()
+
+    def pending(self, event_id):
+        # The newest record not yet committed for event_id, if any, so
+        # readers see their own writes
+        with self._cond:
+            queued = self._pending.get(event_id) or self._writing.get(event_id)
+            return queued[0] if queued is not None else None
+
+    def flush(self, timeout=None):
+        # Write everything queued so far; returns False on timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._pending and not self._writing, timeout)
+
+    def close(self, timeout=None):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending and self._closed:
+                    return
+                if self._failures:
+                    # Back off after a failed write, even when closing
+                    delay = min(RETRY_DELAY * 2 ** (self._failures - 1), MAX_RETRY_DELAY)
+                    deadline = time.monotonic() + delay
+                    self._cond.wait_for(lambda: time.monotonic() >= deadline, delay)
+                # Give further edits a chance to coalesce
+                self._cond.wait_for(lambda: self._flush_requested or self._closed, self.interval)
+                self._writing, self._pending = self._pending, {}
+                self._flush_requested = False
+                batch = self._writing
+                collect, self._collect = self._collect, False
+            try:
+                with metrics.registry.run(collect):
+                    self._write(batch)
+                self._failures = 0
+            except Exception:
+                self._failures += 1
+                if self._failures >= MAX_WRITE_ATTEMPTS:
+                    logger.exception("Background save of %d events failed %d times; giving up", len(batch), self._failures)
+                    self._failures = 0
+                    self._dump(batch)
+                    continue
+                logger.exception("Background save of %d events failed; retrying", len(batch))
+                with self._cond:
+                    # Put the batch back, with anything submitted since
+                    # merged on top of it
+                    for event_id, (record, base_version, base_record) in batch.items():
+                        newer = self._pending.get(event_id)
+                        if newer is not None:
+                            record = rebase_record(newer[2], newer[0], record)
+                        self._pending[event_id] = (record, base_version, base_record)
+            finally:
+                with self._cond:
+                    self._writing = {}
+                    self._cond.notify_all()
+
+    def _dump(self, batch):
+        # Keep the records of a batch that could not be saved, so they can be
+        # re-imported by hand; edits submitted since are still queued
+        metrics.registry.incr("background_writes_dropped")
+        try:
+            fd, path = tempfile.mkstemp(prefix="eco-unsaved-", suffix=".json")
+            with os.fdopen(fd, "w") as f:
+                json.dump({event_id: queued[0] for event_id, queued in batch.items()}, f)
+            logger.error("Wrote the %d unsaved events to %s", len(batch), path)
+        except OSError:
+            logger.exception("Could not keep the %d unsaved events: %s", len(batch), list(batch))
+
+    def _own_base(self, event_id, record, base_version, base_record):
+        committed = self._committed.get(event_id)
+        if committed is not None and committed[0] > base_version and committed[1] == base_record:
+            return record, committed[0], base_record
+        return record, base_version, base_record
+
+    @metrics.registry.timed("background_write")
+    def _write(self, batch):
+        metrics.registry.incr("background_writes")
+        metrics.registry.incr("background_written_events", len(batch))
+        batch = {event_id: self._own_base(event_id, *queued) for event_id, queued in batch.items()}
+        try:
+            versions = self.store.put_many(
+                {event_id: queued[0] for event_id, queued in batch.items()},
+                {event_id: queued[1] for event_id, queued in batch.items()},
+            )
+            for event_id, queued in batch.items():
+                self._committed.put(event_id, (versions[event_id], queued[0]))
+            return
+        except ConflictError:
+            pass
+        # Someone else saved one of these events first; write them one by one
+        for event_id, (record, base_version, base_record) in batch.items():
+            self._write_one(event_id, record, base_version, base_record)
+
+    def _write_one(self, event_id, record, base_version, base_record):
+        expected = base_version
+        for _ in range(MAX_REBASES):
+            try:
+                self._committed.put(event_id, (self.store.put(event_id, record, expected), record))
+                return
+            except ConflictError:
+                metrics.registry.incr("save_rebases")
+                theirs, expected = self.store.get(event_id)
+                record = rebase_record(base_record, record, theirs)
+                # Later attempts are based on the version just read
+                base_record = theirs
+        logger.warning("Gave up saving %s after %d concurrent updates", event_id, MAX_REBASES)
@@ -0,0 +1,232 @@
+import sys
+import uuid
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
+
+from catalog import record_identity, record_name
+from scoring import collect, score_record, score_states
+
+# Secondary indexes over every stored event, so the event picker can list
+# and filter large stores without scanning them:
+#
+#   by type        event_type -> set of ids
+#   by date        sorted list of (event_date, event_id)
+#   by score band  band (0-9, ten points each; 100 falls in band 9) -> ids
+#   by name        lower-cased word of name/owner -> ids, with a sorted
+#                  word list for prefix matches
+#
+# The indexes live in memory, are built with one scan when the registry is
+# created and are kept current by a store observer after every commit. If
+# another process writes the store, the next query rebuilds them.
+
+SCORE_BANDS = 10
+
+Entry = namedtuple("Entry", "event_id name owner event_type event_date score")
+
+REBUILD_CHUNK_SIZE = 5000
+
+# Batch scoring is about twice as fast per event, but importing numpy and
+# pandas for it costs about as much as scoring this many events one at a
+# time; smaller stores are scored one by one unless pandas is already loaded
+BATCH_SCORE_MIN = 200000
+
+BULK_COMMIT_SIZE = 100
+
+
+def new_event_id():
+    return uuid.uuid4().hex
+
+
+def score_band(score):
+    return min(int(score // (100 // SCORE_BANDS)), SCORE_BANDS - 1)
+
+
+def _words(text):
+    return set(text.lower().split())
+
+
+class EventRegistry:
+    def __init__(self, store):
+        self.store = store
+        # Commits update the indexes while holding the store's lock, so
+        # queries take the same one
+        self._lock = store.lock
+        self._clear()
+        store.add_observer(self._on_commit, backfill=self._rebuild)
+
+    def _clear(self):
+        self._entries = {}
+        self._by_type = {}
+        self._by_band = {}
+        self._dates = []
+        self._by_word = {}
+        self._words = []
+        self._generation = None
+
+    def _rebuild(self, store):
+        with self._lock:
+            self._clear()
+            self._generation = store.generation()
+            batch = "pandas" in sys.modules or len(store) >= BATCH_SCORE_MIN
+            chunk = []
+            for event_id, record, _ in store.iter_records():
+                chunk.append((event_id, record))
+                if len(chunk) >= REBUILD_CHUNK_SIZE:
+                    self._add_chunk(chunk, batch)
+                    chunk = []
+            self._add_chunk(chunk, batch)
+            # Sorted once at the end rather than kept sorted per insert
+            self._dates.sort()
+            self._words = sorted(self._by_word)
+
+    def _add_chunk(self, records, batch=True):
+        if not batch:
+            for event_id, record in records:
+                self._add(self._entry(event_id, record), bulk=True)
+            return
+        if not records:
+            return
+        scores = score_states(collect(records))["score"].to_numpy()
+        for (event_id, record), score in zip(records, scores):
+            self._add(self._entry(event_id, record, float(score)), bulk=True)
+
+    def _entry(self, event_id, record, score=None):
+        if score is None:
+            score = score_record(event_id, record)[1].score
+        event_type, event_date = record_identity(event_id, record)
+        return Entry(event_id, record_name(event_id, record), record.get("owner", ""), event_type, event_date or "", score)
+
+    def _on_commit(self, store, changes):
+        with self._lock:
+            if self._generation != store.generation():
+                self._rebuild(store)
+                return
+            for event_id, _, _ in changes:
+                if event_id in self._entries:
+                    self._remove(self._entries[event_id])
+            # Big batches (imports) append and sort once
+            bulk = len(changes) > BULK_COMMIT_SIZE
+            for event_id, _, new_record in changes:
+                self._add(self._entry(event_id, new_record), bulk)
+            if bulk:
+                self._dates.sort()
+                self._words = sorted(self._by_word)
+
+    def _add(self, entry, bulk=False):
+        self._entries[entry.event_id] = entry
+        self._by_type.setdefault(entry.event_type, set()).add(entry.event_id)
+        self._by_band.setdefault(score_band(entry.score), set()).add(entry.event_id)
+        if bulk:
+            self._dates.append((entry.event_date, entry.event_id))
+        else:
+            insort(self._dates, (entry.event_date, entry.event_id))
+        for word in _words(entry.name) | _words(entry.owner):
+            if word not in self._by_word:
+                self._by_word[word] = set()
+                if not bulk:
+                    insort(self._words, word)
+            self._by_word[word].add(entry.event_id)
+
+    def _remove(self, entry):
+        del self._entries[entry.event_id]
+        self._by_type[entry.event_type].discard(entry.event_id)
+        self._by_band[score_band(entry.score)].discard(entry.event_id)
+        position = bisect_left(self._dates, (entry.event_date, entry.event_id))
+        del self._dates[position]
+        for word in _words(entry.name) | _words(entry.owner):
+            ids = self._by_word[word]
+            ids.discard(entry.event_id)
+            if not ids:
+                del self._by_word[word]
+                del self._words[bisect_left(self._words, word)]
+
+    def _sync(self):
+        if self._generation != self.store.generation():
+            self._rebuild(self.store)
+
+    def __len__(self):
+        with self._lock:
+            self._sync()
+            return len(self._entries)
+
+    def get(self, event_id):
+        with self._lock:
+            self._sync()
+            return self._entries.get(event_id)
+
+    def event_types(self):
+        with self._lock:
+            self._sync()
+            return sorted(event_type for event_type, ids in self._by_type.items() if ids)
+
+    def _matching_words(self, prefix):
+        groups = []
+        position = bisect_left(self._words, prefix)
+        while position < len(self._words) and self._words[position].startswith(prefix):
+            groups.append(self._by_word[self._words[position]])
+            position += 1
+        return groups
+
+    def search(self, text="", event_types=None, start_date=None, end_date=None, min_score=None, max_score=None, limit=100):
+        # Entries matching every given filter, newest event date first.
+        # Every word of `text` must prefix a word of the name or owner;
+        # dates and scores are inclusive bounds. Score bands only pick the
+        # candidates; each entry's score is then checked exactly.
+        with self._lock:
+            self._sync()
+            # Each filter is a list of index sets, matched if any of them
+            # contains the event
+            filters = [self._matching_words(prefix) for prefix in _words(text)]
+            if event_types:
+                filters.append([self._by_type[t] for t in event_types if t in self._by_type])
+            if min_score is not None or max_score is not None:
+                low = score_band(min_score or 0)
+                high = score_band(100 if max_score is None else max_score)
+                filters.append([self._by_band[band] for band in range(low, high + 1) if band in self._by_band])
+
+            start_date = None if start_date is None else str(start_date)
+            end_date = None if end_date is None else str(end_date)
+            low = 0 if start_date is None else bisect_left(self._dates, (start_date,))
+            high = len(self._dates) if end_date is None else bisect_right(self._dates, (end_date, "\uffff"))
+
+            def in_score_range(entry):
+                return (min_score is None or entry.score >= min_score) and (max_score is None or entry.score <= max_score)
+
+            def matches_all(event_id):
+                return all(any(event_id in ids for ids in groups) for groups in filters)
+
+            # Either walk the date range newest-first until `limit` events
+            # pass the filters, or intersect the filters' sets and sort what
+            # survives; pick whichever should touch fewer events, treating
+            # the filters as independent
+            sizes = [sum(map(len, groups)) for groups in filters]
+            total = max(len(self._dates), 1)
+            selectivity = 1.0
+            for size in sizes:
+                selectivity *= size / total
+            expected_walk = min(high - low, limit / max(selectivity, 1 / total))
+            if not filters or expected_walk <= min(sizes):
+                matches = []
+                for position in range(high - 1, low - 1, -1):
+                    event_id = self._dates[position][1]
+                    if matches_all(event_id) and in_score_range(self._entries[event_id]):
+                        matches.append(self._entries[event_id])
+                        if len(matches) >= limit:
+                            break
+                return matches
+
+            # Set operations run in C; smallest filter first
+            order = sorted(range(len(filters)), key=sizes.__getitem__)
+            candidates = set().union(*filters[order[0]])
+            for index in order[1:]:
+                groups = filters[index]
+                candidates.intersection_update(groups[0] if len(groups) == 1 else set().union(*groups))
+            matches = [self._entries[event_id] for event_id in candidates]
+            matches = [entry for entry in matches if in_score_range(entry)]
+            if start_date is not None or end_date is not None:
+                matches = [
+                    entry for entry in matches
+                    if (start_date is None or entry.event_date >= start_date) and (end_date is None or entry.event_date <= end_date)
+                ]
+            matches.sort(key=lambda entry: (entry.event_date, entry.event_id), reverse=True)
+            return matches[:limit]
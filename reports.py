@@ -0,0 +1,336 @@
+"""Export a report covering every stored event.
+
+    python reports.py progress.db report.csv
+    python reports.py progress.db q3.html --quarter 2024Q3 --weighted
+    python reports.py progress.db boards.md --type "Board Meeting" --start 2024-01-01
+    python reports.py progress.db report.jsonl --suggestions 5
+
+Each event gets its score, optionally its impact-weighted score, and its
+highest-impact missing measures. Per-type totals (events, mean, median,
+lowest and highest score) follow the events in JSON Lines, HTML and
+Markdown, or go to --summary as CSV. The format follows the output's
+extension unless --format is given.
+
+Events are read from the store as a stream, scored a chunk at a time and
+written out as each chunk is rendered. Per-type totals are running sums
+and a fixed score histogram, so with a SQLite store memory stays the same
+however many events are exported (a JSON store is loaded whole).
+"""
+import argparse
+import csv
+import html
+import io
+import json
+import sys
+import tempfile
+from datetime import date, timedelta
+from itertools import islice
+
+from aggregates import HISTOGRAM_BINS, quantile, score_bin
+from catalog import EVENT_TYPES, ITEMS_BY_ID, record_identity
+from scoring import ImpactWeights, batch_suggestions, collect, score_states
+from storage import open_store
+
+DEFAULT_CHUNK_SIZE = 2000
+
+FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".html": "html", ".htm": "html", ".md": "md"}
+
+MIME_TYPES = {"csv": "text/csv", "jsonl": "application/json", "html": "text/html", "md": "text/markdown"}
+
+EVENT_COLUMNS = ("event_id", "name", "owner", "event_type", "event_date", "implemented", "applicable", "score")
+
+SUMMARY_COLUMNS = ("event_type", "events", "mean_score", "median_score", "min_score", "max_score", "implemented", "applicable")
+
+ALL_EVENTS = "All events"
+
+
+def report_format(path):
+    for suffix, output_format in FORMATS.items():
+        if path.lower().endswith(suffix):
+            return output_format
+    raise ValueError(f"Can't tell the report format of {path}; use .csv, .jsonl, .html or .md")
+
+
+def quarter_range(quarter):
+    # "2024Q3" -> ("2024-07-01", "2024-09-30")
+    year, _, number = quarter.upper().partition("Q")
+    if not (year.isdigit() and number in ("1", "2", "3", "4")):
+        raise ValueError(f"{quarter!r} is not a quarter like 2024Q3")
+    year, first_month = int(year), 3 * int(number) - 2
+    start = date(year, first_month, 1)
+    next_start = date(year + 1, 1, 1) if first_month == 10 else date(year, first_month + 3, 1)
+    return str(start), str(next_start - timedelta(days=1))
+
+
+def _selected(records, start, end, event_types):
+    for event_id, record, _ in records:
+        event_type, event_date = record_identity(event_id, record)
+        if event_types and event_type not in event_types:
+            continue
+        if (start or end) and not event_date:
+            continue
+        if start and event_date < start or end and event_date > end:
+            continue
+        yield event_id, record
+
+
+def event_results(store, start=None, end=None, event_types=None, weights=None, weighted=False,
+                  suggestions=3, chunk_size=DEFAULT_CHUNK_SIZE):
+    # One dict per event in [start, end] (inclusive ISO dates) of the given
+    # types. Scores and suggestions are computed for a chunk at a time with
+    # the batch scorer; suggestions are item texts, highest impact first.
+    weights = weights or ImpactWeights()
+    selected = _selected(store.iter_records(), start and str(start), end and str(end), set(event_types or ()))
+    while True:
+        chunk = list(islice(selected, chunk_size))
+        if not chunk:
+            return
+        states = collect(chunk)
+        scores = score_states(states, weights if weighted else None)
+        columns = {column: scores[column].tolist() for column in ("implemented", "applicable", "score")}
+        weighted_column = scores["weighted_score"].tolist() if weighted else None
+        suggested = batch_suggestions(states, weights, suggestions).tolist() if suggestions else None
+        for index, (event_id, record) in enumerate(chunk):
+            event_type, event_date = record_identity(event_id, record)
+            result = {
+                "event_id": event_id,
+                "name": record.get("name", ""),
+                "owner": record.get("owner", ""),
+                "event_type": event_type,
+                "event_date": event_date or "",
+                "implemented": columns["implemented"][index],
+                "applicable": columns["applicable"][index],
+                "score": round(columns["score"][index], 2),
+            }
+            if weighted:
+                result["weighted_score"] = round(weighted_column[index], 2)
+            if suggestions:
+                result["suggestions"] = [ITEMS_BY_ID[item_id].text for item_id in suggested[index] if item_id >= 0]
+            yield result
+
+
+class TypeTotals:
+    # Running per-type totals over a stream of event results; the median
+    # comes from the same fixed histogram the store aggregates use
+
+    def __init__(self, weighted=False):
+        self.weighted = weighted
+        self._totals = {}
+
+    def add(self, result):
+        for key in (result["event_type"], ALL_EVENTS):
+            totals = self._totals.get(key)
+            if totals is None:
+                totals = self._totals[key] = {
+                    "events": 0, "score_sum": 0.0, "weighted_sum": 0.0, "min_score": 100.0, "max_score": 0.0,
+                    "implemented": 0, "applicable": 0, "histogram": [0] * HISTOGRAM_BINS,
+                }
+            score = result["score"]
+            totals["events"] += 1
+            totals["score_sum"] += score
+            totals["weighted_sum"] += result.get("weighted_score", 0.0)
+            totals["min_score"] = min(totals["min_score"], score)
+            totals["max_score"] = max(totals["max_score"], score)
+            totals["implemented"] += result["implemented"]
+            totals["applicable"] += result["applicable"]
+            totals["histogram"][score_bin(score)] += 1
+
+    def rows(self):
+        # One row per event type in catalog order, then all events together
+        order = [t for t in EVENT_TYPES if t in self._totals]
+        order += sorted(t for t in self._totals if t not in EVENT_TYPES and t != ALL_EVENTS)
+        rows = []
+        for event_type in order + ([ALL_EVENTS] if self._totals else []):
+            totals = self._totals[event_type]
+            events = totals["events"]
+            row = {
+                "event_type": event_type,
+                "events": events,
+                "mean_score": round(totals["score_sum"] / events, 2),
+                "median_score": round(quantile(totals["histogram"], events, 0.5), 2),
+                "min_score": totals["min_score"],
+                "max_score": totals["max_score"],
+                "implemented": totals["implemented"],
+                "applicable": totals["applicable"],
+            }
+            if self.weighted:
+                row["mean_weighted_score"] = round(totals["weighted_sum"] / events, 2)
+            rows.append(row)
+        return rows
+
+
+def _event_columns(weighted, suggestions):
+    return EVENT_COLUMNS + (("weighted_score",) if weighted else ()) + (("suggestions",) if suggestions else ())
+
+
+def _summary_columns(weighted):
+    return SUMMARY_COLUMNS + (("mean_weighted_score",) if weighted else ())
+
+
+def _cell(value):
+    return "; ".join(value) if isinstance(value, list) else value
+
+
+def _csv_lines(rows, columns):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writerows({column: _cell(row.get(column, "")) for column in columns} for row in rows)
+    return buffer.getvalue()
+
+
+def _markdown_row(values):
+    return "| " + " | ".join(str(_cell(value)).replace("|", "\\|").replace("\n", " ") for value in values) + " |\n"
+
+
+def _html_row(values, cell="td"):
+    return "<tr>" + "".join(f"<{cell}>{html.escape(str(_cell(value)))}</{cell}>" for value in values) + "</tr>\n"
+
+
+_HTML_HEAD = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title>
+<style>
+body {{ font-family: sans-serif; color: #1b3a1d; margin: 2em; }}
+h1, h2 {{ color: #2e7d32; }}
+table {{ border-collapse: collapse; margin-bottom: 2em; }}
+th {{ background: #4caf50; color: #fff; }}
+th, td {{ border: 1px solid #c8e6c9; padding: 4px 8px; text-align: left; vertical-align: top; }}
+tr:nth-child(even) td {{ background: #f0f8f0; }}
+</style></head><body>
+<h1>{title}</h1>
+<p>{subtitle}</p>
+"""
+
+
+def render(results, output_format, weighted=False, suggestions=3, title="Eco-Event Report", subtitle="",
+           chunk_size=DEFAULT_CHUNK_SIZE, totals=None):
+    # Yields the report as text, a chunk of `chunk_size` events at a time,
+    # with the per-type totals last. Nothing but the current chunk and the
+    # totals is held. Pass a TypeTotals as `totals` to read them afterwards.
+    columns = _event_columns(weighted, suggestions)
+    summary_columns = _summary_columns(weighted)
+    totals = totals or TypeTotals(weighted)
+    results = iter(results)
+
+    if output_format == "csv":
+        yield _csv_lines([dict(zip(columns, columns))], columns)
+    elif output_format == "md":
+        yield f"# {title}\n\n{subtitle}\n\n## Events\n\n" + _markdown_row(columns) + _markdown_row(["---"] * len(columns))
+    elif output_format == "html":
+        yield _HTML_HEAD.format(title=html.escape(title), subtitle=html.escape(subtitle)) + "<h2>Events</h2>\n<table>\n" + _html_row(columns, "th")
+    elif output_format != "jsonl":
+        raise ValueError(f"Unknown report format {output_format!r}")
+
+    while True:
+        chunk = list(islice(results, chunk_size))
+        if not chunk:
+            break
+        for result in chunk:
+            totals.add(result)
+        if output_format == "csv":
+            yield _csv_lines(chunk, columns)
+        elif output_format == "jsonl":
+            yield "".join(json.dumps(dict(result, kind="event")) + "\n" for result in chunk)
+        elif output_format == "md":
+            yield "".join(_markdown_row([result.get(column, "") for column in columns]) for result in chunk)
+        else:
+            yield "".join(_html_row([result.get(column, "") for column in columns]) for result in chunk)
+
+    rows = totals.rows()
+    if output_format == "jsonl":
+        yield "".join(json.dumps(dict(row, kind="type_summary")) + "\n" for row in rows)
+    elif output_format == "md":
+        yield (
+            "\n## By event type\n\n" + _markdown_row(summary_columns) + _markdown_row(["---"] * len(summary_columns))
+            + "".join(_markdown_row([row[column] for column in summary_columns]) for row in rows)
+        )
+    elif output_format == "html":
+        yield (
+            "</table>\n<h2>By event type</h2>\n<table>\n" + _html_row(summary_columns, "th")
+            + "".join(_html_row([row[column] for column in summary_columns]) for row in rows)
+            + "</table>\n</body></html>\n"
+        )
+    # CSV holds events only; write_summary_csv() writes the totals
+
+
+def write_summary_csv(rows, path, weighted=False):
+    columns = _summary_columns(weighted)
+    with open(path, "w", newline="") as f:
+        f.write(_csv_lines([dict(zip(columns, columns))] + rows, columns))
+
+
+def describe(start=None, end=None, event_types=None):
+    parts = []
+    if start or end:
+        parts.append(f"Events dated {start or 'any time'} to {end or 'any time'}")
+    else:
+        parts.append("All events")
+    if event_types:
+        parts.append("of type " + ", ".join(event_types))
+    return " ".join(parts) + f"; generated {date.today()}."
+
+
+def write_report(store, out, output_format, start=None, end=None, event_types=None, weighted=False,
+                 suggestions=3, chunk_size=DEFAULT_CHUNK_SIZE, title="Eco-Event Report"):
+    # Streams the report into the text file object `out`; returns the
+    # per-type totals
+    results = event_results(store, start, end, event_types, weighted=weighted, suggestions=suggestions, chunk_size=chunk_size)
+    totals = TypeTotals(weighted)
+    for text in render(results, output_format, weighted, suggestions, title, describe(start, end, event_types), chunk_size, totals):
+        out.write(text)
+    return totals.rows()
+
+
+def report_bytes(store, output_format, start=None, end=None, event_types=None, weighted=False, suggestions=3):
+    # The whole report as encoded bytes, for callers that need it in one
+    # piece, like the app's download button; memory grows with the report.
+    # It is rendered into a temporary file first, so the bytes read back
+    # are the only full copy.
+    with tempfile.TemporaryFile() as out:
+        text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+        write_report(store, text, output_format, start, end, event_types, weighted, suggestions)
+        text.flush()
+        text.detach()
+        out.seek(0)
+        return out.read()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("store", help="progress store (.json or .db)")
+    parser.add_argument("output", help=".csv, .jsonl, .html or .md")
+    parser.add_argument("--format", choices=sorted(set(FORMATS.values())), help="defaults to the output file's extension")
+    parser.add_argument("--start", help="first event date to include (YYYY-MM-DD)")
+    parser.add_argument("--end", help="last event date to include (YYYY-MM-DD)")
+    parser.add_argument("--quarter", help="shorthand for --start/--end, e.g. 2024Q3")
+    parser.add_argument("--type", action="append", dest="event_types", metavar="EVENT_TYPE", help="only this event type (repeatable)")
+    parser.add_argument("--weighted", action="store_true", help="add impact-weighted scores")
+    parser.add_argument("--suggestions", type=int, default=3, help="highest-impact missing measures per event (0 for none)")
+    parser.add_argument("--summary", help="also write the per-type totals to this CSV")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    try:
+        output_format = args.format or report_format(args.output)
+        start, end = quarter_range(args.quarter) if args.quarter else (args.start, args.end)
+    except ValueError as error:
+        sys.exit(str(error))
+    for event_type in args.event_types or ():
+        if event_type not in EVENT_TYPES:
+            sys.exit(f"Unknown event type {event_type!r}")
+
+    store = open_store(args.store, cache_size=0)
+    try:
+        with open(args.output, "w", newline="", encoding="utf-8") as out:
+            totals = write_report(
+                store, out, output_format, start, end, args.event_types, args.weighted, args.suggestions, args.chunk_size,
+            )
+    finally:
+        store.close()
+    if args.summary:
+        write_summary_csv(totals, args.summary, args.weighted)
+    events = totals[-1]["events"] if totals else 0
+    print(f"Wrote {events} events to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
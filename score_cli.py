@@ -0,0 +1,204 @@
+"""Score stored events outside Streamlit.
+
+    python score_cli.py score progress.db -o scores.csv --workers 4
+    python score_cli.py score state.csv -o scores.parquet --categories
+    python score_cli.py score progress.db -o scores.csv --weights weights.json
+    python score_cli.py export-state progress.db state.csv
+
+Events are read in chunks, scored across a process pool and written out as
+each chunk finishes. At most a few chunks per worker are in flight, so with
+a SQLite store or a state CSV memory stays bounded however large the store
+is. A JSON store is a single document that is parsed whole before the
+first chunk, so its memory grows with the store; export it once with
+export-state, or migrate it (python storage.py migrate), for large runs.
+"""
+import argparse
+import csv
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import pandas as pd
+
+from catalog import STATE_FIELDS, load_impact_weights, record_to_row, row_to_record
+from scoring import ImpactWeights, category_breakdown, collect, score_states
+from storage import SQLITE_SUFFIXES, open_store
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def streams(path):
+    # Whether a source is read in chunks rather than loaded whole
+    return path.lower().endswith((".csv",) + SQLITE_SUFFIXES)
+
+
+def read_source(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Yields lists of (event_id, record) from a progress store or a CSV
+    # written by export-state
+    if path.lower().endswith(".csv"):
+        for frame in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_size):
+            yield [row_to_record(row) for row in frame.to_dict("records")]
+        return
+    store = open_store(path, cache_size=0)
+    try:
+        for chunk in _chunks(store.iter_records(), chunk_size):
+            yield [(event_id, record) for event_id, record, _ in chunk]
+    finally:
+        store.close()
+
+
+def score_chunk(records, categories=False, weights=None):
+    states = collect(records)
+    scores = score_states(states, weights)
+    if categories:
+        breakdown = category_breakdown(states).add_prefix("category: ").reset_index(drop=True)
+        scores = pd.concat([scores, breakdown], axis=1)
+    return scores
+
+
+def _scored(chunks, workers, categories, weights=None):
+    # Results come back in input order; only workers * 2 chunks are queued
+    # at a time so a slow writer can't let the input pile up in memory
+    if workers <= 1:
+        for chunk in chunks:
+            yield score_chunk(chunk, categories, weights)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(score_chunk, chunk, categories, weights))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class CsvWriter:
+    def __init__(self, path):
+        self.path = path
+        self._header = True
+
+    def write(self, frame):
+        frame.to_csv(self.path, mode="w" if self._header else "a", header=self._header, index=False)
+        self._header = False
+
+    def close(self):
+        pass
+
+
+class ParquetWriter:
+    # One row group per chunk; pyarrow is only needed for Parquet output
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            sys.exit("Parquet output needs pyarrow: pip install pyarrow")
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.path = path
+        self._writer = None
+
+    def write(self, frame):
+        table = self._pa.Table.from_pandas(frame, preserve_index=False)
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table.cast(self._writer.schema))
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def open_writer(path, output_format=None):
+    output_format = output_format or ("parquet" if path.lower().endswith((".parquet", ".pq")) else "csv")
+    return ParquetWriter(path) if output_format == "parquet" else CsvWriter(path)
+
+
+def score_command(args):
+    weights = None
+    if args.weighted or args.weights:
+        try:
+            weights = ImpactWeights(load_impact_weights(args.weights))
+        except (OSError, ValueError) as error:
+            sys.exit(f"Could not load impact weights: {error}")
+    if not streams(args.source) and not args.quiet:
+        print(
+            f"warning: {args.source} is loaded whole, so memory grows with the store; "
+            "use a SQLite store or an export-state CSV to keep it bounded",
+            file=sys.stderr,
+        )
+    writer = open_writer(args.output, args.format)
+    total = 0
+    try:
+        for frame in _scored(read_source(args.source, args.chunk_size), args.workers, args.categories, weights):
+            writer.write(frame)
+            total += len(frame)
+            if not args.quiet:
+                print(f"\rscored {total} events", end="", file=sys.stderr)
+        if not total:
+            # Still write the header/schema so consumers get a valid file
+            writer.write(score_chunk([], args.categories, weights))
+    finally:
+        writer.close()
+    if not args.quiet:
+        print(file=sys.stderr)
+    return total
+
+
+def export_state_command(args):
+    # Flat CSV of every stored event's state, readable by `score`
+    store = open_store(args.store, cache_size=0)
+    total = 0
+    try:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=STATE_FIELDS)
+            writer.writeheader()
+            for event_id, record, _ in store.iter_records():
+                writer.writerow(record_to_row(event_id, record))
+                total += 1
+    finally:
+        store.close()
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    score = commands.add_parser("score", help="score every event in a store or state CSV")
+    score.add_argument("source", help="progress store (.json, " + ", ".join(SQLITE_SUFFIXES) + ") or state .csv")
+    score.add_argument("-o", "--output", required=True, help="output .csv or .parquet")
+    score.add_argument("--format", choices=["csv", "parquet"], help="defaults to the output file's extension")
+    score.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    score.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    score.add_argument("--categories", action="store_true", help="add a score column per checklist category")
+    score.add_argument("--weighted", action="store_true", help="add an impact-weighted score column")
+    score.add_argument("--weights", help="JSON of {item id: weight} overriding the catalog's impact weights (implies --weighted)")
+    score.add_argument("-q", "--quiet", action="store_true")
+
+    export = commands.add_parser("export-state", help="write stored checklist state to CSV")
+    export.add_argument("store")
+    export.add_argument("output")
+
+    args = parser.parse_args(argv)
+    if args.command == "score":
+        score_command(args)
+    else:
+        total = export_state_command(args)
+        print(f"Exported {total} events to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+from collections import namedtuple
+from functools import lru_cache
+
+from catalog import (
+    CHECKLISTS, DEFAULT_IMPACT_WEIGHT, EVENT_TYPES, ITEMS_BY_ID, MAX_ITEM_ID, get_checklist, load_impact_weights,
+    make_record, record_identity, record_state,
+)
+
+# Scores are computed for a whole batch of events at once: every event's
+# implemented/N-A masks are unpacked into rows of a boolean (events x items)
+# matrix, and applicability, counts and category breakdowns become array
+# operations instead of per-item Python loops.
+#
+# numpy and pandas take the better part of a second to import, so they are
+# imported by the batch functions on first use rather than with this module:
+# the per-save scores (score_record, score_event) are plain Python and pages
+# that only need those never load them.
+
+N_BITS = MAX_ITEM_ID + 1
+_N_BYTES = (N_BITS + 7) // 8
+
+_TYPE_CODES = {event_type: code for code, event_type in enumerate(EVENT_TYPES)}
+_OTHER_CODE = _TYPE_CODES["Other Corporate Event"]
+
+CATEGORIES = tuple(dict.fromkeys(
+    category for checklist in CHECKLISTS.values() for category, _ in checklist.categories
+))
+
+Score = namedtuple("Score", "implemented applicable score")
+
+# Unpacked state of a batch of events; row i of every array is event i
+EventStates = namedtuple(
+    "EventStates",
+    "event_ids event_types event_dates implemented na custom_applicable custom_implemented",
+)
+
+
+def bit_matrix(masks):
+    # List of int masks -> (len(masks), N_BITS) bool array, bit i in column i
+    import numpy as np
+
+    buffer = b"".join(mask.to_bytes(_N_BYTES, "little") for mask in masks)
+    packed = np.frombuffer(buffer, dtype=np.uint8).reshape(len(masks), _N_BYTES)
+    return np.unpackbits(packed, axis=1, count=N_BITS, bitorder="little").astype(bool)
+
+
+@lru_cache(maxsize=None)
+def type_items():
+    # (event types x items): the items that belong to each event type
+    return bit_matrix([CHECKLISTS[event_type].mask for event_type in EVENT_TYPES])
+
+
+@lru_cache(maxsize=None)
+def category_items():
+    # (categories x items): the items in each category
+    import numpy as np
+
+    matrix = np.zeros((len(CATEGORIES), N_BITS), dtype=bool)
+    for item in ITEMS_BY_ID.values():
+        matrix[CATEGORIES.index(item.category), item.id] = True
+    return matrix
+
+
+def custom_counts(custom_measures):
+    # (applicable, implemented) among custom measures
+    applicable = done = 0
+    for _, measure_implemented, measure_na in custom_measures:
+        if not measure_na:
+            applicable += 1
+            if measure_implemented:
+                done += 1
+    return applicable, done
+
+
+def collect(records):
+    # records: iterable of (event_id, record[, version]) as yielded by
+    # ProgressStore.iter_records()
+    import numpy as np
+    import pandas as pd
+
+    event_ids, codes, dates = [], [], []
+    implemented_masks, na_masks = [], []
+    custom_applicable, custom_implemented = [], []
+    for entry in records:
+        event_id, record = entry[0], entry[1]
+        event_type, event_date = record_identity(event_id, record)
+        if "catalog_version" in record:
+            implemented, na = record["implemented"], record["na"]
+        else:
+            implemented, na = record_state(record, get_checklist(event_type))
+        applicable, done = custom_counts(record.get("custom_measures", []))
+        event_ids.append(event_id)
+        codes.append(_TYPE_CODES.get(event_type, _OTHER_CODE))
+        dates.append(event_date)
+        implemented_masks.append(implemented)
+        na_masks.append(na)
+        custom_applicable.append(applicable)
+        custom_implemented.append(done)
+    return EventStates(
+        np.array(event_ids, dtype=object),
+        np.array(codes, dtype=np.int8),
+        pd.to_datetime(pd.Series(dates, dtype=object), errors="coerce").to_numpy(),
+        bit_matrix(implemented_masks),
+        bit_matrix(na_masks),
+        np.array(custom_applicable, dtype=np.int32),
+        np.array(custom_implemented, dtype=np.int32),
+    )
+
+
+def _applicable_and_done(states):
+    # An item counts when it belongs to the event type and isn't N/A
+    applicable = type_items()[states.event_types] & ~states.na
+    return applicable, applicable & states.implemented
+
+
+def _percent(implemented, applicable):
+    # No applicable measures scores 100, as the Results page always has
+    import numpy as np
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(applicable > 0, implemented * 100.0 / applicable, 100.0)
+
+
+def score_states(states, weights=None):
+    # With ImpactWeights, also an impact-weighted score per event
+    import numpy as np
+    import pandas as pd
+
+    applicable_items, done_items = _applicable_and_done(states)
+    applicable = applicable_items.sum(axis=1) + states.custom_applicable
+    implemented = done_items.sum(axis=1) + states.custom_implemented
+    scores = pd.DataFrame({
+        "event_id": states.event_ids,
+        "event_type": np.array(EVENT_TYPES, dtype=object)[states.event_types],
+        "event_date": states.event_dates,
+        "month": states.event_dates.astype("datetime64[M]"),
+        "implemented": implemented,
+        "applicable": applicable,
+        "score": _percent(implemented, applicable),
+    })
+    if weights is not None:
+        scores["weighted_score"] = weighted_scores(states, weights, applicable_items, done_items)
+    return scores
+
+
+class ImpactWeights:
+    # Per-item impact weights (catalog.IMPACT_WEIGHTS unless given). For a
+    # single event each type's items are kept as (weight, item id) pairs,
+    # heaviest first, so the Results page scores and picks suggestions in
+    # plain Python; the item vector the batch functions multiply by is
+    # built on first use. Built once per set of weights; a weight change
+    # means building a new one.
+
+    def __init__(self, weights=None, custom_weight=DEFAULT_IMPACT_WEIGHT):
+        self.weights = load_impact_weights() if weights is None else dict(weights)
+        self.custom = custom_weight
+        self.by_type = {
+            event_type: sorted(
+                ((self.weights.get(item.id, DEFAULT_IMPACT_WEIGHT), item.id) for item in checklist.items),
+                key=lambda pair: (-pair[0], pair[1]),
+            )
+            for event_type, checklist in CHECKLISTS.items()
+        }
+        self._items = None
+
+    @property
+    def items(self):
+        # (items,) weight vector; 1.0 for items without a weight
+        if self._items is None:
+            import numpy as np
+
+            items = np.full(N_BITS, DEFAULT_IMPACT_WEIGHT)
+            for item_id, weight in self.weights.items():
+                items[item_id] = weight
+            self._items = items
+        return self._items
+
+    def pairs(self, event_type):
+        # (weight, item id) for the type's items, heaviest first
+        return self.by_type.get(event_type, self.by_type["Other Corporate Event"])
+
+
+def weighted_scores(states, weights, applicable_items=None, done_items=None):
+    # Impact-weighted score of every event in the batch: one matrix-vector
+    # product per side, so re-weighting a whole store is one pass over it
+    import numpy as np
+
+    if applicable_items is None:
+        applicable_items, done_items = _applicable_and_done(states)
+    # float32 so the products go through BLAS, as in category_breakdown()
+    vector = weights.items.astype(np.float32)
+    applicable = (applicable_items.astype(np.float32) @ vector).astype(np.float64) + states.custom_applicable * weights.custom
+    implemented = (done_items.astype(np.float32) @ vector).astype(np.float64) + states.custom_implemented * weights.custom
+    return _percent(implemented, applicable)
+
+
+def weighted_score(event_type, implemented, na, custom_measures, weights):
+    # Impact-weighted counterpart of score_event(); implemented and
+    # applicable are sums of weights rather than counts
+    applicable_weight = implemented_weight = 0.0
+    for weight, item_id in weights.pairs(event_type):
+        if not na >> item_id & 1:
+            applicable_weight += weight
+            if implemented >> item_id & 1:
+                implemented_weight += weight
+    custom_applicable, custom_implemented = custom_counts(custom_measures)
+    applicable_weight += custom_applicable * weights.custom
+    implemented_weight += custom_implemented * weights.custom
+    score = implemented_weight * 100.0 / applicable_weight if applicable_weight else 100.0
+    return Score(implemented_weight, applicable_weight, score)
+
+
+def batch_suggestions(states, weights, k=5):
+    # top_suggestions() for every event of a batch: an (events x k) array
+    # of item ids, highest impact first, padded with -1 when an event has
+    # fewer than k missing items
+    import numpy as np
+
+    applicable_items, done_items = _applicable_and_done(states)
+    gains = (applicable_items & ~done_items) * weights.items
+    # A stable sort of each row keeps ties in item id order
+    order = np.argsort(-gains, axis=1, kind="stable")[:, :k]
+    return np.where(np.take_along_axis(gains, order, axis=1) > 0, order, -1)
+
+
+def top_suggestions(event_type, implemented, na, weights, k=5):
+    # The k missing items (applicable, not implemented) with the most
+    # impact, as (Item, weight), highest first and by item id on ties.
+    # The type's items are already in that order, so this stops at the
+    # k-th missing one.
+    missing = ~(implemented | na)
+    suggestions = []
+    for weight, item_id in weights.pairs(event_type):
+        if len(suggestions) == k or weight <= 0:
+            break
+        if missing >> item_id & 1:
+            suggestions.append((ITEMS_BY_ID[item_id], weight))
+    return suggestions
+
+
+def category_breakdown(states):
+    # Per-category score for every event; NaN where the event type has no
+    # applicable items in that category. Custom measures have no category.
+    import numpy as np
+    import pandas as pd
+
+    applicable_items, done_items = _applicable_and_done(states)
+    # float32 so the products go through BLAS; counts stay exact
+    weights = category_items().T.astype(np.float32)
+    applicable = (applicable_items.astype(np.float32) @ weights).astype(np.float64)
+    implemented = (done_items.astype(np.float32) @ weights).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = np.where(applicable > 0, implemented * 100.0 / applicable, np.nan)
+    return pd.DataFrame(scores, index=pd.Index(states.event_ids, name="event_id"), columns=CATEGORIES)
+
+
+def summarize(scores, by=("event_type",)):
+    grouped = scores.groupby(list(by))
+    aggregations = dict(
+        events=("score", "size"),
+        mean_score=("score", "mean"),
+        median_score=("score", "median"),
+        implemented=("implemented", "sum"),
+        applicable=("applicable", "sum"),
+    )
+    if "weighted_score" in scores:
+        aggregations["mean_weighted_score"] = ("weighted_score", "mean")
+    return grouped.agg(**aggregations)
+
+
+def score_store(store, weights=None):
+    return score_states(collect(store.iter_records()), weights)
+
+
+def score_record(event_id, record):
+    # Scalar version of score_states() for one stored record, for callers
+    # that need a score per save rather than per batch:
+    # (event_type, Score)
+    event_type, _ = record_identity(event_id, record)
+    checklist = get_checklist(event_type)
+    implemented, na = record_state(record, checklist)
+    applicable_items = checklist.mask & ~na
+    custom_applicable, custom_implemented = custom_counts(record.get("custom_measures", []))
+    applicable = bin(applicable_items).count("1") + custom_applicable
+    done = bin(applicable_items & implemented).count("1") + custom_implemented
+    score = done * 100.0 / applicable if applicable else 100.0
+    return checklist.event_type, Score(done, applicable, score)
+
+
+def score_event(event_type, implemented, na, custom_measures):
+    # Same counts as the batch path, without loading numpy and pandas for
+    # one event
+    record = make_record(event_type, None, implemented, na, custom_measures, None)
+    return score_record("", record)[1]
@@ -0,0 +1,560 @@
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Where progress is kept; a .db/.sqlite path selects the SQLite backend
+DEFAULT_STORE_PATH = os.environ.get("ECO_PROGRESS_STORE", "progress.json")
+
+# How many decoded events the shared cache keeps in memory
+DEFAULT_CACHE_SIZE = int(os.environ.get("ECO_EVENT_CACHE_SIZE", "512"))
+
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+
+JSON_FORMAT = 2
+
+
+class ConflictError(Exception):
+    # Raised when an event was changed by someone else since it was read
+    def __init__(self, event_id, expected, actual):
+        super().__init__(f"{event_id}: expected version {expected}, store has {actual}")
+        self.event_id = event_id
+        self.expected = expected
+        self.actual = actual
+
+
+def _dumps(record):
+    return json.dumps(record)
+
+
+def read_json_progress(path):
+    try:
+        with open(path, "r") as f:
+            content = f.read()
+            if not content.strip():
+                return {}  # Return empty dict if file is empty
+            return json.loads(content)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}  # Return empty dict if file is not found or has invalid JSON
+
+
+class LRUCache:
+    # Not thread-safe on its own; the store guards it with its lock
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+
+    def get(self, key):
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class ProgressStore:
+    # Process-wide store shared by every session. Only the event_id ->
+    # version index is held for every event; decoded records live in a
+    # bounded LRU cache and are read from the backend on a miss. A cached
+    # record is only served while its version matches the index, so any
+    # commit invalidates it. Records handed out are shared: treat them as
+    # read-only and put() a new dict instead.
+    #
+    # put() only succeeds against the version the caller read, so
+    # concurrent edits to one event are detected instead of lost.
+    #
+    # Listeners see every (old, new) record pair of a put before it is
+    # committed and can bump named counters with increment(); the counter
+    # deltas are committed in the same atomic write as the events.
+    # Observers get the same pairs, as one list per commit, once the commit
+    # has succeeded; in-memory indexes rebuild when generation() changes,
+    # which happens when another process's writes force a reload. The data
+    # is saved by then, so an observer that fails (e.g. the history log
+    # finding its database locked) is logged and skipped rather than
+    # failing the put or keeping the other observers from seeing it.
+
+    def __init__(self, path, cache_size=DEFAULT_CACHE_SIZE):
+        self.path = path
+        self._lock = threading.RLock()
+        self._versions = {}
+        self._counters = {}
+        self._cache = LRUCache(cache_size)
+        self._listeners = []
+        self._observers = []
+        self._staged = None
+        self._loaded = False
+        self._generation = 0
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self._versions = self._read_index()
+            self._counters = self._read_counters()
+            self._loaded = True
+            self._generation += 1
+
+    @property
+    def lock(self):
+        # Held while committing; in-memory indexes fed by observers share it
+        # so readers never see them half-updated
+        return self._lock
+
+    def generation(self):
+        # Bumped whenever the index is (re)loaded from the backend
+        with self._lock:
+            self._ensure_loaded()
+            return self._generation
+
+    def add_listener(self, listener, backfill=None):
+        # listener(store, event_id, old_record, new_record); old_record is
+        # None for a new event. backfill(store), if given, runs under the
+        # same lock so an index can catch up on existing events without a
+        # save slipping in between.
+        with self._lock:
+            self._listeners.append(listener)
+            if backfill is not None:
+                backfill(self)
+
+    def add_observer(self, observer, backfill=None):
+        # observer(store, changes), called after each successful commit
+        # with a list of (event_id, old_record, new_record); backfill as
+        # for add_listener()
+        with self._lock:
+            self._observers.append(observer)
+            if backfill is not None:
+                backfill(self)
+
+    def counters(self):
+        with self._lock:
+            self._ensure_loaded()
+            return dict(self._counters)
+
+    def increment(self, name, delta):
+        # Only valid while a listener is running inside put_many()
+        self._staged[name] = self._staged.get(name, 0) + delta
+
+    def add_counters(self, deltas):
+        # Commit counter deltas on their own, e.g. when rebuilding an index
+        with self._lock:
+            self._ensure_loaded()
+            self._commit({}, {}, deltas)
+            self._apply_counters(deltas)
+
+    def _apply_counters(self, deltas):
+        for name, delta in deltas.items():
+            self._counters[name] = self._counters.get(name, 0) + delta
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._versions)
+
+    def event_ids(self):
+        with self._lock:
+            self._ensure_loaded()
+            return list(self._versions)
+
+    def version(self, event_id):
+        with self._lock:
+            self._ensure_loaded()
+            return self._versions.get(event_id, 0)
+
+    def get(self, event_id):
+        with self._lock:
+            self._ensure_loaded()
+            return self._get_loaded(event_id)
+
+    def _get_loaded(self, event_id):
+        version = self._versions.get(event_id, 0)
+        if not version:
+            return None, 0
+        cached = self._cache.get(event_id)
+        if cached is not None and cached[0] == version:
+            metrics.registry.incr("event_cache_hits")
+            return cached[1], version
+        metrics.registry.incr("event_cache_misses")
+        record, version = self._read(event_id)
+        if record is None:
+            self._versions.pop(event_id, None)
+            return None, 0
+        self._versions[event_id] = version
+        self._cache.put(event_id, (version, record))
+        return record, version
+
+    def size_bytes(self):
+        # On-disk size, including SQLite's write-ahead log
+        return sum(
+            os.path.getsize(path)
+            for path in (self.path, self.path + "-wal")
+            if os.path.exists(path)
+        )
+
+    def put(self, event_id, record, expected_version=None):
+        return self.put_many({event_id: record}, {event_id: expected_version})[event_id]
+
+    def put_many(self, records, expected_versions=None):
+        # All-or-nothing: every expected version is checked before anything
+        # is written, and the batch is committed as one atomic write.
+        expected_versions = expected_versions or {}
+        serialized = {event_id: _dumps(record) for event_id, record in records.items()}
+        with self._lock:
+            self._ensure_loaded()
+            for event_id in records:
+                expected = expected_versions.get(event_id)
+                actual = self._versions.get(event_id, 0)
+                if expected is not None and expected != actual:
+                    raise ConflictError(event_id, expected, actual)
+            new_versions = {event_id: self._versions.get(event_id, 0) + 1 for event_id in records}
+            decoded = {event_id: json.loads(data) for event_id, data in serialized.items()}
+            changes = []
+            if self._listeners or self._observers:
+                changes = [(event_id, self._get_loaded(event_id)[0], record) for event_id, record in decoded.items()]
+            deltas = self._run_listeners(changes)
+            self._commit(serialized, new_versions, deltas)
+            for event_id, record in decoded.items():
+                self._versions[event_id] = new_versions[event_id]
+                self._cache.put(event_id, (new_versions[event_id], record))
+            self._apply_counters(deltas)
+            for observer in self._observers:
+                try:
+                    observer(self, changes)
+                except Exception:
+                    metrics.registry.incr("observer_errors")
+                    logger.exception("Observer %r failed after saving %d events", observer, len(changes))
+            return new_versions
+
+    def _run_listeners(self, changes):
+        if not self._listeners:
+            return {}
+        self._staged = {}
+        try:
+            for event_id, old_record, record in changes:
+                for listener in self._listeners:
+                    listener(self, event_id, old_record, record)
+            return self._staged
+        finally:
+            self._staged = None
+
+    def _read_index(self):
+        raise NotImplementedError
+
+    def _read_counters(self):
+        raise NotImplementedError
+
+    def _read(self, event_id):
+        raise NotImplementedError
+
+    def iter_records(self):
+        # Streams (event_id, record, version) for every event without
+        # filling the shared cache
+        raise NotImplementedError
+
+    def _commit(self, serialized, new_versions, counter_deltas):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JsonProgressStore(ProgressStore):
+    # A single JSON document can't be patched in place, so every commit
+    # writes a temp file next to the store and renames it over the old one;
+    # readers never see a half-written file. Events are kept as their
+    # serialized strings and only decoded when requested.
+
+    def __init__(self, path, cache_size=DEFAULT_CACHE_SIZE):
+        super().__init__(path, cache_size)
+        self._serialized = {}
+        self._stored_counters = {}
+        self._file_state = None
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _ensure_loaded(self):
+        # Another process (e.g. the import CLI) replacing the file changes
+        # its inode, mtime or size; reload it rather than overwrite it from
+        # a stale copy on the next commit, as SQLite does on data_version
+        file_state = self._stat()
+        if file_state != self._file_state:
+            self._loaded = False
+            self._file_state = file_state
+        super()._ensure_loaded()
+
+    def _read_index(self):
+        data = read_json_progress(self.path)
+        self._stored_counters = data.get("counters", {}) if data.get("format") == JSON_FORMAT else {}
+        if data.get("format") == JSON_FORMAT:
+            events = data.get("events", {})
+            stored_versions = data.get("versions", {})
+            versions = {event_id: stored_versions.get(event_id, 1) for event_id in events}
+        else:
+            # Legacy layout: a flat {event_id: record} dict
+            events = data
+            versions = {event_id: 1 for event_id in events}
+        self._serialized = {event_id: _dumps(record) for event_id, record in events.items()}
+        return versions
+
+    def _read_counters(self):
+        return dict(self._stored_counters)
+
+    def _read(self, event_id):
+        self._ensure_loaded()
+        data = self._serialized.get(event_id)
+        if data is None:
+            return None, 0
+        return json.loads(data), self._versions[event_id]
+
+    def iter_records(self):
+        with self._lock:
+            self._ensure_loaded()
+            # Commits replace these dicts rather than mutating them
+            serialized, versions = self._serialized, self._versions.copy()
+        for event_id, data in serialized.items():
+            yield event_id, json.loads(data), versions.get(event_id, 1)
+
+    def _commit(self, serialized, new_versions, counter_deltas):
+        events = dict(self._serialized)
+        events.update(serialized)
+        versions = dict(self._versions)
+        versions.update(new_versions)
+        counters = dict(self._counters)
+        for name, delta in counter_deltas.items():
+            counters[name] = counters.get(name, 0) + delta
+        body = ", ".join(f"{json.dumps(event_id)}: {data}" for event_id, data in events.items())
+        document = (
+            f'{{"format": {JSON_FORMAT}, "versions": {json.dumps(versions)}, '
+            f'"counters": {json.dumps(counters)}, "events": {{{body}}}}}'
+        )
+        atomic_write(self.path, document)
+        self._file_state = self._stat()
+        self._serialized = events
+
+
+def atomic_write(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".progress-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class SqliteProgressStore(ProgressStore):
+    # One row per event with its version; only the changed rows are written,
+    # inside a single transaction.
+
+    def __init__(self, path, cache_size=DEFAULT_CACHE_SIZE):
+        super().__init__(path, cache_size)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            " event_id TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL,"
+            " version INTEGER NOT NULL DEFAULT 1)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS counters ("
+            " name TEXT PRIMARY KEY,"
+            " value REAL NOT NULL)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(events)")]
+        if "version" not in columns:
+            self._conn.execute("ALTER TABLE events ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        self._data_version = None
+
+    def _ensure_loaded(self):
+        # Another process writing the same database bumps data_version; the
+        # index is reloaded and stale cache entries fail the version check
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self._data_version:
+            self._loaded = False
+            self._data_version = data_version
+        super()._ensure_loaded()
+
+    def _read_index(self):
+        return dict(self._conn.execute("SELECT event_id, version FROM events"))
+
+    def _read_counters(self):
+        return dict(self._conn.execute("SELECT name, value FROM counters"))
+
+    def _read(self, event_id):
+        row = self._conn.execute("SELECT data, version FROM events WHERE event_id = ?", (event_id,)).fetchone()
+        if row is None:
+            return None, 0
+        return json.loads(row[0]), row[1]
+
+    def iter_records(self):
+        # A separate read connection streams rows without holding the
+        # store lock; WAL lets it run alongside writers
+        reader = sqlite3.connect(self.path)
+        try:
+            cursor = reader.execute("SELECT event_id, data, version FROM events")
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    break
+                for event_id, data, version in rows:
+                    yield event_id, json.loads(data), version
+        finally:
+            reader.close()
+
+    def _commit(self, serialized, new_versions, counter_deltas):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            for event_id, data in serialized.items():
+                version = new_versions[event_id]
+                if version == 1:
+                    cursor = self._conn.execute(
+                        "INSERT OR IGNORE INTO events (event_id, data, version) VALUES (?, ?, 1)",
+                        (event_id, data),
+                    )
+                else:
+                    cursor = self._conn.execute(
+                        "UPDATE events SET data = ?, version = ? WHERE event_id = ? AND version = ?",
+                        (data, version, event_id, version - 1),
+                    )
+                if cursor.rowcount != 1:
+                    # Changed by another process since we last looked
+                    row = self._conn.execute("SELECT version FROM events WHERE event_id = ?", (event_id,)).fetchone()
+                    raise ConflictError(event_id, version - 1, row[0] if row else 0)
+            # Deltas, not values, so concurrent writers never overwrite each other
+            self._conn.executemany(
+                "INSERT INTO counters (name, value) VALUES (?, ?)"
+                " ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                counter_deltas.items(),
+            )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            self._loaded = False
+            raise
+
+    def close(self):
+        self._conn.close()
+
+
+def open_store(path=DEFAULT_STORE_PATH, cache_size=DEFAULT_CACHE_SIZE):
+    if path.lower().endswith(SQLITE_SUFFIXES):
+        return SqliteProgressStore(path, cache_size)
+    return JsonProgressStore(path, cache_size)
+
+
+class ProgressSession:
+    # One browser session's view of the shared store: just the event that
+    # is currently selected, the version it was based on and its last saved
+    # form. Every other event stays in the store's shared cache, so session
+    # memory doesn't grow with the number of events.
+    #
+    # With a write-behind persister, save() hands the record over and
+    # returns at once; reads prefer records still queued there, so a
+    # session always sees its own edits.
+    #
+    # `loads` counts the times open() or a failed save() replaced the
+    # record with a different one, so a UI can reset widgets that still
+    # show the old one.
+
+    def __init__(self, store, persister=None):
+        self.store = store
+        self.persister = persister
+        self.event_id = None
+        self.record = None
+        self.version = 0
+        self._base = None
+        self._saved = None
+        self.loads = 0
+
+    def is_dirty(self):
+        return self.record is not None and _dumps(self.record) != self._saved
+
+    def open(self, event_id):
+        # Switch to event_id, or pick up another user's newer save of the
+        # current event as long as this session has nothing unsaved
+        if event_id != self.event_id or (not self.is_dirty() and self.store.version(event_id) != self.version):
+            self._refresh(event_id)
+        return self.record
+
+    def _refresh(self, event_id):
+        record, version = self.store.get(event_id)
+        if self.persister is not None:
+            record = self.persister.pending(event_id) or record
+        if event_id != self.event_id or record != self.record:
+            self.loads += 1
+        self.event_id = event_id
+        self.record = record
+        self.version = version
+        self._base = record
+        self._saved = _dumps(record) if record is not None else None
+
+    def update(self, record):
+        self.record = record
+
+    def save(self):
+        # Returns False if someone else saved the event first; the session is
+        # then reloaded with their version. Never fails with a persister,
+        # which merges concurrent edits instead.
+        if not self.is_dirty():
+            return True
+        serialized = _dumps(self.record)
+        if self.persister is not None:
+            self.persister.submit(self.event_id, self.record, self.version, self._base)
+        else:
+            try:
+                self.version = self.store.put(self.event_id, self.record, self.version)
+            except ConflictError:
+                self._refresh(self.event_id)
+                return False
+        self._base = self.record
+        self._saved = serialized
+        return True
+
+
+def migrate_json_to_sqlite(json_path, db_path):
+    source = JsonProgressStore(json_path, cache_size=0)
+    records = {event_id: record for event_id, record, _ in source.iter_records()}
+    store = SqliteProgressStore(db_path)
+    try:
+        store.put_many(records, {event_id: store.version(event_id) for event_id in records})
+    finally:
+        store.close()
+    return len(records)
+
+
+if __name__ == "__main__":
+    # python storage.py migrate progress.json progress.db
+    if len(sys.argv) != 4 or sys.argv[1] != "migrate":
+        sys.exit("usage: python storage.py migrate <progress.json> <progress.db>")
+    total = migrate_json_to_sqlite(sys.argv[2], sys.argv[3])
+    print(f"Migrated {total} events from {sys.argv[2]} to {sys.argv[3]}")